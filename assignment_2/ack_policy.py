@@ -0,0 +1,60 @@
+from typing import Optional
+
+import constants
+from timers import Timer
+
+
+class AckPolicy(object):
+    """ Decides when the receiver sends cumulative ACKs.
+
+    In-order packets are acknowledged every `every` packets or once `delay` seconds
+    have passed since the first unacknowledged one, whichever comes first. Out-of-order
+    packets are acknowledged immediately so loss recovery is not slowed down.
+    """
+
+    def __init__(self, every: int = constants.ACK_EVERY,
+                 delay: float = constants.ACK_DELAY):
+        """ Constructor.
+
+        Args:
+            every: Number of in-order packets to coalesce into one ACK.
+            delay: Maximum number of seconds an in-order packet waits to be ACKed.
+        """
+        self.every = every
+        self.delay = delay
+        self.pending = 0
+        self.timer = Timer(delay)
+
+    def on_in_order(self) -> bool:
+        """ Records an in-order packet.
+
+        Returns:
+            True if an ACK should be sent now, False if it may be delayed.
+        """
+        self.pending += 1
+        if not self.timer.is_armed():
+            self.timer.reset()
+        return self.pending >= self.every
+
+    def on_out_of_order(self) -> bool:
+        """ Records an out-of-order packet.
+
+        Returns:
+            True, out-of-order packets are always ACKed immediately.
+        """
+        return True
+
+    def is_due(self) -> bool:
+        """ Returns True if a delayed ACK has reached its deadline. False, otherwise."""
+        return self.timer.expired()
+
+    def time_until_due(self) -> Optional[float]:
+        """ Returns the number of seconds until the delayed ACK is due, or None if no
+        ACK is pending.
+        """
+        return self.timer.time_until()
+
+    def sent(self):
+        """ Records that a cumulative ACK was sent, clearing any pending ACK."""
+        self.pending = 0
+        self.timer.cancel()
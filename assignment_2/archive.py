@@ -0,0 +1,210 @@
+from collections import deque
+import os
+from typing import List, Optional, Tuple
+
+import constants
+from custom_exceptions import ArchiveException
+from writer import FileWriter
+
+
+def list_files(paths: List[str]) -> List[Tuple[str, str]]:
+    """ Expands files and directories into the files to send.
+
+    Args:
+        paths: Files and directories. A directory is sent with everything below it,
+            under its own name.
+
+    Returns:
+        (path on disk, name in the archive) tuples, in the order they are sent. Names
+        use "/" as the separator.
+    """
+    files = []
+    for path in paths:
+        path = os.path.normpath(path)
+        if not os.path.isdir(path):
+            files.append((path, os.path.basename(path)))
+            continue
+        parent = os.path.dirname(path)
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                full = os.path.join(root, name)
+                files.append((full, os.path.relpath(full, parent).replace(os.sep, "/")))
+    return files
+
+
+def encode_header(name: str, size: int) -> bytes:
+    """ Returns the header sent in front of a file's contents: the length of the
+    name (2 bytes), the UTF-8 name and the size of the file (8 bytes).
+    """
+    encoded = name.encode("utf-8")
+    return len(encoded).to_bytes(length=constants.ARCHIVE_NAME_LENGTH_SIZE,
+                                 byteorder="big") + \
+        encoded + size.to_bytes(length=constants.ARCHIVE_FILE_SIZE_SIZE, byteorder="big")
+
+
+class ArchiveReader(object):
+    """ Reads several files as one stream of headers and contents.
+
+    Has the same read(size) interface as a binary file, so the sender fills every
+    packet across file boundaries and its window never drains between files.
+    """
+
+    def __init__(self, files: List[Tuple[str, str]]):
+        """ Constructor.
+
+        Args:
+            files: (path on disk, name in the archive) tuples to send, in order.
+        """
+        self._files = deque(files)
+        self._file = None
+        self._path = None
+        self._remaining = 0
+        self._header = b""
+        # Number of header bytes read so far, the rest of the stream is file contents.
+        self.header_bytes = 0
+
+    def _next_file(self):
+        path, name = self._files.popleft()
+        self._file = open(path, "rb")
+        self._path = path
+        self._remaining = os.fstat(self._file.fileno()).st_size
+        self._header = encode_header(name, self._remaining)
+
+    def read(self, size: int) -> bytes:
+        """ Returns the next size bytes of the stream, fewer only at its end.
+
+        Args:
+            size: Number of bytes to read.
+        """
+        chunks = []
+        while size > 0:
+            if self._header:
+                chunk = self._header[:size]
+                self._header = self._header[size:]
+                self.header_bytes += len(chunk)
+            elif self._remaining:
+                chunk = self._file.read(min(size, self._remaining))
+                if not chunk:
+                    raise ArchiveException(f"{self._path} shrank while being sent.")
+                self._remaining -= len(chunk)
+            elif self._files:
+                if self._file:
+                    self._file.close()
+                self._next_file()
+                continue
+            else:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ArchiveWriter(object):
+    """ Splits the stream written by an ArchiveReader back into files.
+
+    Has the same write/flush/close interface as FileWriter. Files are saved below a
+    directory; names that would escape it are skipped.
+    """
+
+    def __init__(self, directory: str, buffer_size: int = constants.WRITE_BUFFER_SIZE):
+        """ Constructor.
+
+        Args:
+            directory: The directory to save files into.
+            buffer_size: Number of bytes of each file to hold in memory before writing
+                to disk.
+        """
+        self.directory = directory
+        self.buffer_size = buffer_size
+        os.makedirs(directory, exist_ok=True)
+        self._header = bytearray()
+        # Writer of the file being received, None while its contents are discarded.
+        self._writer = None
+        self._remaining = 0
+        self.files = []
+
+    def get_path(self, name: str) -> Optional[str]:
+        """ Returns where a file from the archive is saved, None if its name is
+        absolute or leads outside the directory.
+        """
+        name = os.path.normpath(name)
+        if os.path.isabs(name) or name in (os.curdir, os.pardir) or \
+                name.startswith(os.pardir + os.sep):
+            return None
+        return os.path.join(self.directory, name)
+
+    def _header_bytes_needed(self) -> int:
+        needed = constants.ARCHIVE_NAME_LENGTH_SIZE
+        if len(self._header) >= needed:
+            needed += int.from_bytes(self._header[:needed], byteorder="big") + \
+                constants.ARCHIVE_FILE_SIZE_SIZE
+        return needed - len(self._header)
+
+    def _start_file(self):
+        name_end = constants.ARCHIVE_NAME_LENGTH_SIZE + \
+            int.from_bytes(self._header[:constants.ARCHIVE_NAME_LENGTH_SIZE],
+                           byteorder="big")
+        name = self._header[constants.ARCHIVE_NAME_LENGTH_SIZE:name_end].decode(
+            "utf-8", errors="replace")
+        self._remaining = int.from_bytes(self._header[name_end:], byteorder="big")
+        self._header.clear()
+
+        path = self.get_path(name)
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.files.append(path)
+        if self._remaining:
+            # Preallocating truncates whatever was there before.
+            self._writer = FileWriter(path, self.buffer_size, preallocate=self._remaining)
+        else:
+            open(path, "wb").close()
+
+    def write(self, data: bytes):
+        """ Writes the next bytes of the stream.
+
+        Args:
+            data: The bytes following all previously written data.
+        """
+        view = memoryview(data)
+        while view:
+            if self._remaining:
+                chunk = view[:self._remaining]
+                if self._writer is not None:
+                    self._writer.write(chunk)
+                self._remaining -= len(chunk)
+                if self._remaining == 0 and self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+            else:
+                # Headers may be split across packets.
+                chunk = view[:self._header_bytes_needed()]
+                self._header.extend(chunk)
+                if self._header_bytes_needed() == 0:
+                    self._start_file()
+            view = view[len(chunk):]
+
+    def flush(self):
+        """ Writes all buffered data of the current file to disk."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """ Flushes and closes the current file, which is left partial if the stream
+        ended inside it.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,121 @@
+from argparse import ArgumentParser
+import asyncio
+from socket import SOL_SOCKET, SO_RCVBUF
+from typing import Tuple
+
+import constants
+from receiver import Receiver, add_receiver_arguments, logger
+
+
+class AsyncReceiver(Receiver, asyncio.DatagramProtocol):
+    """ Receiver driven by an asyncio event loop.
+
+    Packets are handled as they arrive through datagram_received and delayed ACKs are
+    sent from a loop.call_later handle, so one process can receive many transfers
+    concurrently.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """ Constructor. Takes the same arguments as Receiver."""
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.done = None
+        self.ack_timer = None
+        self.linger_timer = None
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        if self.done.done():
+            return
+        p = self.handle_message(data)
+        if p and p.type == constants.TYPE_EOT:
+            self.done.set_result(p)
+            return
+        if self.error is not None:
+            self.linger()
+            return
+        self.schedule_ack()
+
+    def error_received(self, exc: Exception):
+        logger.log(f"Socket error: {exc}.")
+
+    def linger(self):
+        """ Keeps answering the sender's packets with ABORT, in case the first was
+        lost, until none has arrived for constants.ABORT_LINGER seconds.
+        """
+        if self.linger_timer is not None:
+            self.linger_timer.cancel()
+        self.linger_timer = self.loop.call_later(constants.ABORT_LINGER,
+                                                 self.done.set_result, None)
+
+    def schedule_ack(self):
+        """ Arms the delayed ACK timer if an ACK is being held back.
+        """
+        if self.ack_timer is not None:
+            self.ack_timer.cancel()
+            self.ack_timer = None
+        delay = self.acks.time_until_due()
+        if delay is not None:
+            self.ack_timer = self.loop.call_later(delay, self.on_ack_timer)
+
+    def on_ack_timer(self):
+        self.ack_timer = None
+        # Send any coalesced ACK whose delay has expired.
+        if self.acks.is_due():
+            self.send_ack(self.seq_num)
+            logger.log(f"Sending delayed ACK with no: {self.seq_num}")
+        self.schedule_ack()
+
+    async def run_async(self):
+        """ Receives the file until EOT.
+        """
+        self.open()
+
+        self.loop = asyncio.get_running_loop()
+        self.done = self.loop.create_future()
+        transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: self, local_addr=(self.hostname, self.data_port))
+        # Room for a full window of the largest packets.
+        transport.get_extra_info("socket").setsockopt(SOL_SOCKET, SO_RCVBUF,
+                                                      constants.SOCKET_BUFFER_SIZE)
+
+        # ACKs go out through the transport; it has the same sendto as a socket.
+        self.ack_socket.close()
+        self.ack_socket = transport
+        try:
+            eot = await self.done
+        finally:
+            if self.ack_timer is not None:
+                self.ack_timer.cancel()
+
+        if eot is not None:
+            self.close(eot)
+        transport.close()
+
+    def run(self):
+        """ Runs the receiver on a new event loop.
+        """
+        asyncio.run(self.run_async())
+
+
+def main():
+    # Parse arguments
+    parser = ArgumentParser(description='Async Receiver')
+    parser.add_argument("hostname", type=str,
+                        help="The hostname of the network emulator to connect to.")
+    parser.add_argument("ack_port", type=int,
+                        help="The port to send ack messages to on the emulator.")
+    parser.add_argument("data_port", type=int,
+                        help="The port the emulator will send data packets to the receiver via.")
+    add_receiver_arguments(parser)
+    args = parser.parse_args()
+
+    # Run Receiver
+    receiver = AsyncReceiver(args.hostname, args.ack_port, args.data_port,
+                             args.filename, args.preallocate, args.ack_every,
+                             args.ack_delay, args.sack, args.stats,
+                             archive=args.archive, resume=args.resume)
+    receiver.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+from argparse import ArgumentParser
+import asyncio
+import time
+from typing import Tuple
+
+from packet import packet
+
+import constants
+from custom_exceptions import CorruptPacketException, TransferAbortedException
+from handshake import ConnectionParameters
+from readahead import PacketReader
+from sender import Sender, add_sender_arguments, logger
+from stats import SenderStats
+
+
+class AsyncSender(Sender, asyncio.DatagramProtocol):
+    """ Sender driven by an asyncio event loop instead of an ACK thread.
+
+    ACKs arrive through datagram_received and the retransmission and pacing timers
+    are loop.call_later handles, so all state is only touched from the loop and one
+    process can run many transfers concurrently. Blocks of packets are taken from
+    the reader on the loop's executor, one block ahead, so waiting for the disk never
+    blocks the loop.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """ Constructor. Takes the same arguments as Sender."""
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.transport = None
+        self.file = None
+        # Iterator over the file's blocks of encoded packets, the packets left in the
+        # current block, the read of the next block and the next packet to send.
+        self.blocks = None
+        self.block = None
+        self.next_block = None
+        self.next_packet = None
+        # False once every packet of the file has been taken.
+        self.reading = False
+        self.eot_sent = False
+        self.done = None
+        self.timer = None
+        self.start = None
+        self.confirmed = None
+        self.resumed = None
+
+    def send_EOT(self, seq_num):
+        """ Sends an EOT packet.
+        """
+        self.transport.sendto(
+            packet.create_eot(seq_num, self.connection_id).get_udp_data(),
+            (self.hostname, self.data_port))
+        logger.log(f"Sent EOT with: {seq_num}.")
+
+    def send_syn(self):
+        """ Sends a SYN proposing the transfer's settings.
+        """
+        self.transport.sendto(
+            self.get_proposal().create_syn(self.connection_id).get_udp_data(),
+            (self.hostname, self.data_port))
+        logger.log("Sent SYN.")
+
+    async def handshake(self) -> ConnectionParameters:
+        """ Proposes the transfer's settings to the receiver, resending the SYN
+        whenever the timeout expires.
+
+        Returns:
+            The settings the receiver confirmed.
+        """
+        self.confirmed = self.loop.create_future()
+        while not self.confirmed.done():
+            self.send_syn()
+            await asyncio.wait([self.confirmed], timeout=constants.TIMEOUT_VALUE / 1000)
+        return self.confirmed.result()
+
+    def send_resume(self):
+        """ Sends a request asking the receiver where to continue the file from.
+        """
+        self.transport.sendto(
+            packet.create_resume(connection_id=self.connection_id).get_udp_data(),
+            (self.hostname, self.data_port))
+        logger.log("Sent resume request.")
+
+    async def request_resume(self) -> int:
+        """ Asks the receiver where to continue the file from, resending the request
+        whenever the timeout expires.
+
+        Returns:
+            The byte offset to continue from.
+        """
+        self.resumed = self.loop.create_future()
+        while not self.resumed.done():
+            self.send_resume()
+            await asyncio.wait([self.resumed], timeout=constants.TIMEOUT_VALUE / 1000)
+        self.resume_offset = self.resumed.result()
+        logger.log(f"Resuming from byte: {self.resume_offset}")
+        self.stats.resume_offset = self.resume_offset
+        return self.resume_offset
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        try:
+            p = packet.parse_udp_data(data)
+        except (TypeError, CorruptPacketException) as e:
+            logger.log(f"Received data that could not be processed: {e}.")
+            return
+
+        if p.connection_id != self.connection_id:
+            logger.log(f"Ignored packet for connection: {p.connection_id}")
+            return
+
+        if p.type == constants.TYPE_ACK:
+            logger.log(f"Received ack with seq: {p.seq_num}")
+            logger.ack(p.seq_num)
+            # ACKs are cumulative for the last in-order packet received.
+            self.window.handle_ack((p.seq_num + 1) % self.window.modulo,
+                                   p.get_sack_blocks())
+            self.next_seq_num = self.window.base_number
+            self.update_delivered()
+            self.send()
+
+        elif p.type == constants.TYPE_SYN:
+            if self.confirmed is not None and not self.confirmed.done():
+                self.confirmed.set_result(ConnectionParameters.parse_syn(p))
+
+        elif p.type == constants.TYPE_RESUME:
+            if self.resumed is not None and not self.resumed.done():
+                self.resumed.set_result(p.get_resume_offset())
+
+        elif p.type == constants.TYPE_EOT:
+            logger.log("Received EOT.")
+            if not self.done.done():
+                self.done.set_result(None)
+
+        elif p.type == constants.TYPE_ABORT:
+            logger.log("Received ABORT.")
+            self.abort(TransferAbortedException("The receiver aborted the transfer."))
+
+    def error_received(self, exc: Exception):
+        logger.log(f"Socket error: {exc}.")
+
+    def start_reading(self, reader: PacketReader):
+        """ Starts taking the packets to send from a reader.
+
+        Args:
+            reader: The reader of the file.
+        """
+        self.blocks = reader.blocks()
+        self.block = iter(())
+        self.reading = True
+        self.fetch_block()
+
+    def fetch_block(self):
+        """ Reads the next block of packets on the loop's executor, and sends once it
+        has been read.
+        """
+        self.next_block = self.loop.run_in_executor(None, next, self.blocks, None)
+        self.next_block.add_done_callback(self.on_block)
+
+    def on_block(self, _):
+        if self.next_packet is None and self.reading and not self.done.done():
+            self.send()
+
+    def advance(self):
+        """ Moves self.next_packet on to the next packet of the file. It is None while
+        the block holding it is still being read, and once self.reading is False.
+        """
+        self.next_packet = next(self.block, None)
+        if self.next_packet is not None or not self.next_block.done():
+            return
+        try:
+            block = self.next_block.result()
+        except Exception as e:
+            # Still reading, so no EOT is sent for the part of the file that was.
+            self.abort(e)
+            return
+        if block is None:
+            self.reading = False
+            self.end_of_file()
+            return
+        self.block = iter(block)
+        self.next_packet = next(self.block, None)
+        self.fetch_block()
+
+    def abort(self, error: Exception):
+        """ Ends the transfer, raising the error from run_async.
+
+        Args:
+            error: Why the transfer cannot go on.
+        """
+        if self.done.done():
+            return
+        logger.log(f"Aborting transmission: {error}")
+        self.done.set_exception(error)
+
+    def end_of_file(self):
+        """ Called once every packet of the file has been added to the window.
+        """
+        self.window.flush_parity((self.hostname, self.data_port))
+        logger.log(f"Ending transmission. {self.window.outstanding()} packets in "
+                   f"flight.")
+
+    def send(self):
+        """ Sends as much as the window and pacer allow, then the EOT once every
+        packet has been acknowledged, and re-arms the timer.
+        """
+        addr = (self.hostname, self.data_port)
+        self.window.send_pending(addr)
+        if self.next_packet is None and self.reading:
+            self.advance()
+        while self.next_packet and not self.window.has_pending_resend() and \
+                not self.window.is_full() and self.window.time_until_send() <= 0:
+            data, udp_data, file_bytes = self.next_packet
+            self.window.add_data(data, addr, udp_data, file_bytes)
+            self.advance()
+
+        if not self.reading and not self.eot_sent and \
+                not self.window.has_pending_resend() and \
+                self.window.finished(self.next_seq_num):
+            logger.log(f"Finished sending remaining packets.")
+            self.send_EOT(self.window.seq_number)
+            self.eot_sent = True
+            self.window.reset_timer()
+
+        self.schedule()
+
+    def schedule(self):
+        """ Arms a single timer for the earlier of the retransmission timeout and the
+        pacer releasing the next packet.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+
+        delay = None
+        if self.eot_sent or self.window.outstanding():
+            delay = max(0.0, self.window.time_until_timeout())
+        if self.window.has_pending_resend() or \
+                (self.next_packet and not self.window.is_full()):
+            pacing = self.window.time_until_send()
+            delay = pacing if delay is None else min(delay, pacing)
+        self.timer = self.loop.call_later(delay, self.on_timer) \
+            if delay is not None else None
+
+    def on_timer(self):
+        self.timer = None
+        if self.window.time_until_timeout() <= 0:
+            if self.eot_sent:
+                self.send_EOT(self.window.seq_number)
+                self.window.reset_timer()
+            elif self.window.outstanding():
+                self.window.resend_all((self.hostname, self.data_port))
+        self.send()
+
+    async def run_async(self):
+        """ Transmits the file and waits for the receiver's EOT.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.done = self.loop.create_future()
+        self.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: self, local_addr=(self.hostname, self.ack_port))
+
+        self.stats = SenderStats()
+
+        with self.open_file() as self.file:
+            self.start = time.monotonic()
+            self.stats.start()
+            self.configure(await self.handshake())
+            self.window = self.create_window(self.transport.sendto)
+            if self.resume:
+                self.file.seek(await self.request_resume())
+            with self.create_reader(self.file) as reader:
+                self.start_reading(reader)
+                self.send()
+                try:
+                    await self.done
+                finally:
+                    if self.timer is not None:
+                        self.timer.cancel()
+                    self.transport.close()
+
+        # Log Transmission Time
+        logger.time(str(1000 * (time.monotonic() - self.start)))
+        logger.log("Done.")
+        self.stats.finish()
+        self.stats.save(self.stats_file)
+
+    def run(self):
+        """ Runs the transfer on a new event loop.
+        """
+        asyncio.run(self.run_async())
+
+
+def main():
+    # Parse arguments
+    parser = ArgumentParser(description='Async Sender')
+    parser.add_argument("hostname", type=str,
+                        help="The hostname of the network emulator to connect to.")
+    parser.add_argument("data_port", type=int,
+                        help="The port to send the emulator data.")
+    parser.add_argument("ack_port", type=int,
+                        help="The port to receive ack messages from the sender (via emulator).")
+    add_sender_arguments(parser)
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the bytes a receiver with --resume already "
+                             "has.")
+    args = parser.parse_args()
+
+    # Run Sender
+    sender = AsyncSender(args.hostname, args.ack_port, args.data_port, args.filename,
+                         args.fec, args.pace_rate, args.pace_rtt, args.stats,
+                         args.connection_id, args.resume, args.window,
+                         args.sequence_bits, args.checksum, args.mss, args.read_ahead,
+                         args.mmap, compress=args.compress)
+    sender.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,644 @@
+from argparse import ArgumentParser
+import datetime
+import filecmp
+import heapq
+import json
+import logging
+import os
+from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF, timeout
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional, Tuple
+import zlib
+
+import constants
+import gso
+import log
+from packet import packet
+from timers import Timer, TimerWheel
+
+BENCHMARK_HOST = "127.0.0.1"
+BENCHMARK_DATA_PORT = 21001
+BENCHMARK_ACK_PORT = 21002
+BENCHMARK_STARTUP_WAIT = 0.2
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def benchmark_receiver(count: int) -> float:
+    """ Measures how many packets per second a receiver.py process can accept.
+
+    Packets are sent in order straight to the receiver (no emulator), keeping at most
+    constants.WINDOW_SIZE packets unacknowledged, followed by an EOT. There is no
+    handshake, so the receiver uses its default settings.
+
+    Args:
+        count: Number of data packets to send.
+
+    Returns:
+        The receive rate in packets per second.
+    """
+    # Run in a scratch directory so the output file and logs are discarded.
+    scratch = tempfile.TemporaryDirectory()
+    receiver = subprocess.Popen(
+        [sys.executable, os.path.join(SOURCE_DIRECTORY, "receiver.py"), BENCHMARK_HOST,
+         str(BENCHMARK_ACK_PORT), str(BENCHMARK_DATA_PORT), "output"],
+        cwd=scratch.name)
+    time.sleep(0.5)
+
+    addr = (BENCHMARK_HOST, BENCHMARK_DATA_PORT)
+    ack_socket = socket(AF_INET, SOCK_DGRAM)
+    ack_socket.bind((BENCHMARK_HOST, BENCHMARK_ACK_PORT))
+    ack_socket.settimeout(constants.TIMEOUT_VALUE / 1000)
+    data_socket = socket(AF_INET, SOCK_DGRAM)
+    payload = b"x" * constants.BUFFER_SIZE
+
+    start = time.perf_counter()
+    acked = -1
+    for num in range(count):
+        data_socket.sendto(packet.create_packet(
+            num % constants.MODULO_RANGE, payload).get_udp_data(), addr)
+        while num - acked >= constants.WINDOW_SIZE:
+            try:
+                p = packet.parse_udp_data(ack_socket.recvfrom(constants.ACK_BUFFER_SIZE)[0])
+            except timeout:
+                for resend in range(acked + 1, num + 1):
+                    data_socket.sendto(packet.create_packet(
+                        resend % constants.MODULO_RANGE, payload).get_udp_data(), addr)
+                continue
+            delta = (p.seq_num - acked) % constants.MODULO_RANGE
+            if p.type == constants.TYPE_ACK and delta <= num - acked:
+                acked += delta
+
+    while True:
+        data_socket.sendto(packet.create_eot(count % constants.MODULO_RANGE).get_udp_data(), addr)
+        try:
+            p = packet.parse_udp_data(ack_socket.recvfrom(constants.ACK_BUFFER_SIZE)[0])
+        except timeout:
+            continue
+        if p.type == constants.TYPE_EOT:
+            break
+    elapsed = time.perf_counter() - start
+
+    receiver.wait()
+    scratch.cleanup()
+    return count / elapsed
+
+
+def benchmark_checksum(count: int) -> Tuple[float, float]:
+    """ Measures the cost of the CRC32 checksum computed when a packet is encoded and
+    again when it is parsed.
+
+    Args:
+        count: Number of full-size data packets to encode and parse.
+
+    Returns:
+        A tuple consisting of:
+            * Encoded and parsed packets per second.
+            * Seconds per packet spent computing checksums.
+    """
+    payload = os.urandom(constants.BUFFER_SIZE)
+    header = bytes(12)
+
+    start = time.perf_counter()
+    for num in range(count):
+        packet.parse_udp_data(packet.create_packet(num, payload).get_udp_data())
+    packet_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for num in range(count):
+        zlib.crc32(payload, zlib.crc32(header))
+        zlib.crc32(payload, zlib.crc32(header))
+    checksum_time = time.perf_counter() - start
+
+    return count / packet_time, checksum_time / count
+
+
+def benchmark_logging(count: int) -> Tuple[float, float]:
+    """ Measures the hot-path cost of recording one log event.
+
+    Args:
+        count: Number of events to record.
+
+    Returns:
+        A tuple consisting of:
+            * Seconds per event with log.BackgroundLogFile.
+            * Seconds per event with a synchronous logging.FileHandler.
+    """
+    scratch = tempfile.TemporaryDirectory()
+
+    background = log.BackgroundLogFile(os.path.join(scratch.name, "background.log"))
+    start = time.perf_counter()
+    for num in range(count):
+        background.write(num % constants.MODULO_RANGE)
+    background_time = (time.perf_counter() - start) / count
+    background.close()
+
+    synchronous = logging.Logger("benchmark-synchronous")
+    handler = logging.FileHandler(os.path.join(scratch.name, "synchronous.log"))
+    synchronous.addHandler(handler)
+    start = time.perf_counter()
+    for num in range(count):
+        synchronous.info(num % constants.MODULO_RANGE)
+    synchronous_time = (time.perf_counter() - start) / count
+    handler.close()
+
+    scratch.cleanup()
+    return background_time, synchronous_time
+
+
+def benchmark_timers(count: int, window: int) -> Tuple[float, float, float, float]:
+    """ Measures the cost of retransmission timers per packet sent.
+
+    Args:
+        count: Number of packets to time.
+        window: Number of per-packet deadlines outstanding at once.
+
+    Returns:
+        A tuple consisting of:
+            * Seconds per packet to restart and check the window's timer with
+              datetime.datetime.now() and timedelta arithmetic.
+            * Seconds per packet to do the same with timers.Timer.
+            * Seconds per packet to arm and cancel a per-packet deadline on a
+              timers.TimerWheel.
+            * Seconds per packet to do the same on a heap, cancelling lazily.
+    """
+    timeout = datetime.timedelta(milliseconds=constants.TIMEOUT_VALUE)
+    start = time.perf_counter()
+    for _ in range(count):
+        timer = datetime.datetime.now()
+        (timer + timeout - datetime.datetime.now()).total_seconds()
+        datetime.datetime.now() > timer + timeout
+    datetime_time = (time.perf_counter() - start) / count
+
+    timer = Timer(constants.TIMEOUT_VALUE / 1000)
+    start = time.perf_counter()
+    for _ in range(count):
+        timer.reset()
+        timer.time_until()
+        timer.expired()
+    timer_time = (time.perf_counter() - start) / count
+
+    wheel = TimerWheel()
+    start = time.perf_counter()
+    for num in range(count):
+        wheel.arm(num, constants.TIMEOUT_VALUE / 1000)
+        if num >= window:
+            wheel.cancel(num - window)
+    wheel_time = (time.perf_counter() - start) / count
+
+    # A heap cannot remove an entry in place, so cancelled ones are skipped once they
+    # reach the top.
+    heap = []
+    deadlines = {}
+    delay = constants.TIMEOUT_VALUE * 1000000
+    start = time.perf_counter()
+    for num in range(count):
+        deadline = time.monotonic_ns() + delay
+        deadlines[num] = deadline
+        heapq.heappush(heap, (deadline, num))
+        if num >= window:
+            del deadlines[num - window]
+        while heap and deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+    heap_time = (time.perf_counter() - start) / count
+
+    return datetime_time, timer_time, wheel_time, heap_time
+
+
+def run_transfer(scratch: str, sources: List[str], output: str,
+                 receiver_args: List[str] = (), sender_args: List[str] = (),
+                 sender: str = "sender.py") -> float:
+    """ Runs one receiver.py/sender.py pair over loopback.
+
+    Args:
+        scratch: Directory to run the processes in.
+        sources: Files or directories to send.
+        output: File or directory to receive into.
+        receiver_args: Extra arguments for the receiver.
+        sender_args: Extra arguments for the sender.
+        sender: The sender script to run, e.g. async_sender.py.
+
+    Returns:
+        The transmission time in milliseconds logged by the sender.
+    """
+    receiver = subprocess.Popen(
+        [sys.executable, os.path.join(SOURCE_DIRECTORY, "receiver.py"), BENCHMARK_HOST,
+         str(BENCHMARK_ACK_PORT), str(BENCHMARK_DATA_PORT), output, *receiver_args],
+        cwd=scratch)
+    time.sleep(BENCHMARK_STARTUP_WAIT)
+    subprocess.run(
+        [sys.executable, os.path.join(SOURCE_DIRECTORY, sender), BENCHMARK_HOST,
+         str(BENCHMARK_DATA_PORT), str(BENCHMARK_ACK_PORT), *sources, *sender_args],
+        cwd=scratch, check=True)
+    receiver.wait()
+    with open(os.path.join(scratch, "time.log"), "r") as f:
+        return float(f.readlines()[-1])
+
+
+def benchmark_files(count: int, size: int) -> Tuple[float, float, float, float]:
+    """ Compares sending many small files with one process pair per file against
+    sending them all in one archive session.
+
+    Args:
+        count: Number of files.
+        size: Size of each file in bytes.
+
+    Returns:
+        A tuple consisting of:
+            * Wall-clock seconds with one process pair per file.
+            * Sum of the logged transmission times in seconds with one pair per file.
+            * Wall-clock seconds with one session.
+            * Logged transmission time in seconds of the session.
+    """
+    scratch = tempfile.TemporaryDirectory()
+    directory = os.path.join(scratch.name, "files")
+    os.makedirs(directory)
+    sources = []
+    for num in range(count):
+        sources.append(os.path.join(directory, f"{num}.bin"))
+        with open(sources[-1], "wb") as f:
+            f.write(os.urandom(size))
+
+    start = time.perf_counter()
+    per_file_transmission = 0
+    for num, source in enumerate(sources):
+        per_file_transmission += run_transfer(scratch.name, [source], f"output-{num}")
+    per_file_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    session_transmission = run_transfer(scratch.name, [directory], "output",
+                                        ["--archive"])
+    session_time = time.perf_counter() - start
+
+    scratch.cleanup()
+    return (per_file_time, per_file_transmission / 1000, session_time,
+            session_transmission / 1000)
+
+
+def benchmark_payload(payload_sizes: List[int], size: int) -> List[float]:
+    """ Measures the throughput of one file transfer over loopback for several
+    payload sizes.
+
+    Args:
+        payload_sizes: Bytes of data per packet to try.
+        size: Size of the file in bytes.
+
+    Returns:
+        The throughput in bytes per second for each payload size.
+    """
+    scratch = tempfile.TemporaryDirectory()
+    source = os.path.join(scratch.name, "source.bin")
+    with open(source, "wb") as f:
+        f.write(os.urandom(size))
+
+    throughputs = []
+    for payload_size in payload_sizes:
+        transmission = run_transfer(scratch.name, [source], "output",
+                                    sender_args=["--mss", str(payload_size)])
+        throughputs.append(size / (transmission / 1000))
+
+    scratch.cleanup()
+    return throughputs
+
+
+def benchmark_acks(runs: int, size: int, window: int) -> List[Tuple[float, float, int]]:
+    """ Stresses the window shared by the sender's ACK thread and main thread with
+    one ACK per packet over loopback, checking every transfer arrives intact.
+
+    Args:
+        runs: Number of transfers.
+        size: Size of the file in bytes.
+        window: Window size to send with.
+
+    Returns:
+        For each transfer, a tuple consisting of:
+            * ACKs received per second.
+            * Throughput in bytes per second.
+            * Number of packets resent after a timeout.
+    """
+    scratch = tempfile.TemporaryDirectory()
+    source = os.path.join(scratch.name, "source.bin")
+    with open(source, "wb") as f:
+        f.write(os.urandom(size))
+
+    results = []
+    for run in range(runs):
+        # The receiver appends to an existing file.
+        output = f"output-{run}"
+        transmission = run_transfer(scratch.name, [source], output,
+                                    receiver_args=["--ack-every", "1"],
+                                    sender_args=["--window", str(window)])
+        if not filecmp.cmp(source, os.path.join(scratch.name, output),
+                           shallow=False):
+            raise RuntimeError("Received file does not match the file sent.")
+        with open(os.path.join(scratch.name, constants.SENDER_STATS_LOG), "r") as f:
+            stats = json.load(f)
+        results.append((stats["acks_received"] / (transmission / 1000),
+                        size / (transmission / 1000),
+                        stats["retransmissions"]["timeout"]))
+
+    scratch.cleanup()
+    return results
+
+
+def benchmark_fanout(receivers: int, size: int) -> Tuple[float, float, float]:
+    """ Compares sending a file to several receivers with one sender per receiver
+    against one fanout_sender.py, which reads the file once.
+
+    Args:
+        receivers: Number of receivers.
+        size: Size of the file in bytes.
+
+    Returns:
+        A tuple consisting of:
+            * Wall-clock seconds with one sender.py per receiver, one after another.
+            * Wall-clock seconds with one async_sender.py per receiver, which the
+              fan-out sender is built on.
+            * Wall-clock seconds with one fan-out sender.
+    """
+    scratch = tempfile.TemporaryDirectory()
+    source = os.path.join(scratch.name, "source.bin")
+    with open(source, "wb") as f:
+        f.write(os.urandom(size))
+
+    start = time.perf_counter()
+    for num in range(receivers):
+        run_transfer(scratch.name, [source], f"sequential-{num}")
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for num in range(receivers):
+        run_transfer(scratch.name, [source], f"async-{num}", sender="async_sender.py")
+    async_time = time.perf_counter() - start
+
+    # Every receiver sends its ACKs to its own port.
+    ports = [(BENCHMARK_DATA_PORT + 2 * num, BENCHMARK_ACK_PORT + 2 * num)
+             for num in range(receivers)]
+    processes = [subprocess.Popen(
+        [sys.executable, os.path.join(SOURCE_DIRECTORY, "receiver.py"), BENCHMARK_HOST,
+         str(ack_port), str(data_port), f"fanout-{num}"], cwd=scratch.name)
+        for num, (data_port, ack_port) in enumerate(ports)]
+    time.sleep(BENCHMARK_STARTUP_WAIT)
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(SOURCE_DIRECTORY, "fanout_sender.py"),
+         BENCHMARK_HOST, source] +
+        [arg for data_port, ack_port in ports
+         for arg in ("--receiver", BENCHMARK_HOST, str(data_port), str(ack_port))],
+        cwd=scratch.name, check=True)
+    for process in processes:
+        process.wait()
+    fanout_time = time.perf_counter() - start
+
+    for num in range(receivers):
+        if not filecmp.cmp(source, os.path.join(scratch.name, f"fanout-{num}"),
+                           shallow=False):
+            raise RuntimeError("Received file does not match the file sent.")
+
+    scratch.cleanup()
+    return sequential_time, async_time, fanout_time
+
+
+def benchmark_gso(count: int) -> Optional[Tuple[float, float, float, float]]:
+    """ Measures how fast full-size packets are sent and received over loopback with
+    one syscall per packet and with UDP GSO and GRO.
+
+    Args:
+        count: Number of packets to send each way.
+
+    Returns:
+        None if the kernel does not support UDP GSO and GRO. Otherwise a tuple
+        consisting of packets per second:
+            * Sent with one sendto each.
+            * Sent in batches with gso.BatchSender.
+            * Received with one recvfrom each.
+            * Received with gso.receive_segments.
+    """
+    udp_data = packet.create_packet(0, os.urandom(constants.BUFFER_SIZE)).get_udp_data()
+    # Small enough for the receive buffer to hold, so no packet is dropped.
+    rounds = range(0, count, constants.GSO_MAX_SEGMENTS * 16)
+
+    rates = []
+    for batched in (False, True):
+        receiver = socket(AF_INET, SOCK_DGRAM)
+        receiver.setsockopt(SOL_SOCKET, SO_RCVBUF, constants.SOCKET_BUFFER_SIZE)
+        receiver.bind((BENCHMARK_HOST, 0))
+        receiver.setblocking(False)
+        sender = socket(AF_INET, SOCK_DGRAM)
+        addr = receiver.getsockname()
+        if batched:
+            batch_sender = gso.create_batch_sender(sender)
+            if batch_sender is None or not gso.enable_gro(receiver):
+                return None
+            sendto = batch_sender.sendto
+        else:
+            sendto = sender.sendto
+
+        send_time = receive_time = 0
+        for start in rounds:
+            size = min(count - start, constants.GSO_MAX_SEGMENTS * 16)
+            begin = time.perf_counter()
+            for _ in range(size):
+                sendto(udp_data, addr)
+            if batched:
+                batch_sender.flush()
+            send_time += time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            received = 0
+            while received < size:
+                if batched:
+                    received += len(gso.receive_segments(receiver)[0])
+                else:
+                    receiver.recvfrom(constants.PACKET_DATA_SIZE)
+                    received += 1
+            receive_time += time.perf_counter() - begin
+        if batched and not batch_sender.enabled:
+            return None
+        rates.append((count / send_time, count / receive_time))
+        sender.close()
+        receiver.close()
+
+    (plain_send, plain_receive), (gso_send, gro_receive) = rates
+    return plain_send, gso_send, plain_receive, gro_receive
+
+
+def benchmark_compression(source: str, copies: int) -> Tuple[float, float, float, float]:
+    """ Compares the throughput of loopback transfers with and without --compress, on
+    text and on random data of the same size.
+
+    Args:
+        source: Text file to send.
+        copies: Number of copies of the text file to send as one file.
+
+    Returns:
+        A tuple consisting of bytes of the file delivered per second:
+            * Of the text without compression.
+            * Of the text with compression.
+            * Of random data without compression.
+            * Of random data with compression.
+    """
+    scratch = tempfile.TemporaryDirectory()
+    with open(source, "rb") as f:
+        text = f.read() * copies
+    sources = {"text": text, "random": os.urandom(len(text))}
+
+    throughputs = []
+    for name, data in sources.items():
+        path = os.path.join(scratch.name, f"{name}.bin")
+        with open(path, "wb") as f:
+            f.write(data)
+        for compress in (False, True):
+            # The receiver appends to an existing file.
+            output = f"{name}-{int(compress)}"
+            transmission = run_transfer(scratch.name, [path], output,
+                                        sender_args=["--compress"] if compress else [])
+            if not filecmp.cmp(path, os.path.join(scratch.name, output), shallow=False):
+                raise RuntimeError("Received file does not match the file sent.")
+            throughputs.append(len(data) / (transmission / 1000))
+
+    scratch.cleanup()
+    return tuple(throughputs)
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark')
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    receiver_parser = subparsers.add_parser(
+        "receiver", help="Packets per second accepted by receiver.py.")
+    receiver_parser.add_argument("--count", type=int, default=10000,
+                                 help="Number of packets to send.")
+
+    checksum_parser = subparsers.add_parser(
+        "checksum", help="Overhead of packet checksums on encode and parse.")
+    checksum_parser.add_argument("--count", type=int, default=200000,
+                                 help="Number of packets to encode and parse.")
+    checksum_parser.add_argument("--receive-count", type=int, default=10000,
+                                 help="Number of packets to send to the receiver.")
+
+    logging_parser = subparsers.add_parser(
+        "logging", help="Cost of recording a sequence/ack/arrival log event.")
+    logging_parser.add_argument("--count", type=int, default=200000,
+                                help="Number of events to record.")
+
+    files_parser = subparsers.add_parser(
+        "files", help="Many small files, one process pair each vs one session.")
+    files_parser.add_argument("--count", type=int, default=50,
+                              help="Number of files to send.")
+    files_parser.add_argument("--size", type=int, default=2000,
+                              help="Size of each file in bytes.")
+
+    payload_parser = subparsers.add_parser(
+        "payload", help="Loopback throughput as a function of payload size.")
+    payload_parser.add_argument("--sizes", type=int, nargs="+",
+                                default=[constants.BUFFER_SIZE, 1024, 4096, 8192, 16384,
+                                         32768, constants.MAX_PAYLOAD_SIZE],
+                                help="Payload sizes in bytes to try.")
+    payload_parser.add_argument("--size", type=int, default=50 * 1000 * 1000,
+                                help="Size of the file to send in bytes.")
+
+    timers_parser = subparsers.add_parser(
+        "timers", help="Cost of retransmission timers per packet.")
+    timers_parser.add_argument("--count", type=int, default=200000,
+                               help="Number of packets to time.")
+    timers_parser.add_argument("--window", type=int, default=constants.MAX_WINDOW_SIZE,
+                               help="Number of per-packet deadlines outstanding.")
+
+    acks_parser = subparsers.add_parser(
+        "acks", help="Loopback transfers with an ACK for every packet.")
+    acks_parser.add_argument("--runs", type=int, default=5,
+                             help="Number of transfers.")
+    acks_parser.add_argument("--size", type=int, default=20 * 1000 * 1000,
+                             help="Size of the file to send in bytes.")
+    acks_parser.add_argument("--window", type=int, default=constants.MAX_WINDOW_SIZE,
+                             help="Window size to send with.")
+
+    fanout_parser = subparsers.add_parser(
+        "fanout", help="One sender per receiver vs one fan-out sender.")
+    fanout_parser.add_argument("--receivers", type=int, default=4,
+                               help="Number of receivers.")
+    fanout_parser.add_argument("--size", type=int, default=20 * 1000 * 1000,
+                               help="Size of the file to send in bytes.")
+
+    gso_parser = subparsers.add_parser(
+        "gso", help="Packets per second sent and received with and without UDP "
+                    "GSO/GRO.")
+    gso_parser.add_argument("--count", type=int, default=200000,
+                            help="Number of packets to send.")
+    compression_parser = subparsers.add_parser(
+        "compression", help="Loopback throughput with and without --compress.")
+    compression_parser.add_argument("--source",
+                                    default=os.path.join(SOURCE_DIRECTORY, "large.txt"),
+                                    help="Text file to send.")
+    compression_parser.add_argument("--copies", type=int, default=20,
+                                    help="Number of copies of the text file to send as "
+                                         "one file.")
+    args = parser.parse_args()
+
+    if args.benchmark == "receiver":
+        rate = benchmark_receiver(args.count)
+        print(f"receiver: {args.count} packets, {rate:.0f} packets/s")
+    elif args.benchmark == "checksum":
+        rate, checksum_cost = benchmark_checksum(args.count)
+        receive_rate = benchmark_receiver(args.receive_count)
+        print(f"checksum: {1e9 * checksum_cost:.0f} ns/packet, "
+              f"{100 * checksum_cost * rate:.1f}% of encode+parse "
+              f"({rate:.0f} packets/s), "
+              f"{100 * checksum_cost * receive_rate:.1f}% of receive "
+              f"({receive_rate:.0f} packets/s)")
+    elif args.benchmark == "logging":
+        background, synchronous = benchmark_logging(args.count)
+        print(f"logging: {1e9 * background:.0f} ns/event in the background, "
+              f"{1e9 * synchronous:.0f} ns/event with logging.FileHandler")
+    elif args.benchmark == "files":
+        per_file, per_file_transmission, session, session_transmission = \
+            benchmark_files(args.count, args.size)
+        print(f"files: {args.count} x {args.size} bytes, "
+              f"{per_file:.2f} s ({per_file_transmission:.2f} s transmitting) with one "
+              f"process pair per file, {session:.2f} s ({session_transmission:.2f} s "
+              f"transmitting) in one session")
+    elif args.benchmark == "payload":
+        throughputs = benchmark_payload(args.sizes, args.size)
+        for payload_size, throughput in zip(args.sizes, throughputs):
+            print(f"payload: {payload_size} bytes, {throughput / 1e6:.1f} MB/s")
+    elif args.benchmark == "timers":
+        datetime_time, timer_time, wheel_time, heap_time = \
+            benchmark_timers(args.count, args.window)
+        print(f"timers: window timer {1e9 * datetime_time:.0f} ns/packet with datetime, "
+              f"{1e9 * timer_time:.0f} ns/packet with time.monotonic_ns; "
+              f"{args.window} per-packet deadlines {1e9 * wheel_time:.0f} ns/packet on "
+              f"a timer wheel, {1e9 * heap_time:.0f} ns/packet on a heap")
+    elif args.benchmark == "acks":
+        for acks, throughput, resent in benchmark_acks(args.runs, args.size,
+                                                       args.window):
+            print(f"acks: {acks:.0f} ACKs/s, {throughput / 1e6:.1f} MB/s, "
+                  f"{resent} packets resent after a timeout")
+    elif args.benchmark == "fanout":
+        sequential, sequential_async, fanout = benchmark_fanout(args.receivers,
+                                                                args.size)
+        print(f"fanout: {args.receivers} receivers x {args.size} bytes, "
+              f"{sequential:.2f} s with one sender.py each, {sequential_async:.2f} s "
+              f"with one async_sender.py each, {fanout:.2f} s with one fan-out sender "
+              f"reading the file once")
+    elif args.benchmark == "gso":
+        rates = benchmark_gso(args.count)
+        if rates is None:
+            print("gso: UDP GSO/GRO is not supported by this kernel")
+        else:
+            plain_send, gso_send, plain_receive, gro_receive = rates
+            print(f"gso: sent {plain_send:.0f} packets/s with sendto, {gso_send:.0f} "
+                  f"packets/s with GSO; received {plain_receive:.0f} packets/s with "
+                  f"recvfrom, {gro_receive:.0f} packets/s with GRO")
+    elif args.benchmark == "compression":
+        text, compressed_text, random, compressed_random = \
+            benchmark_compression(args.source, args.copies)
+        print(f"compression: text {text / 1e6:.1f} MB/s, {compressed_text / 1e6:.1f} "
+              f"MB/s compressed; random data {random / 1e6:.1f} MB/s, "
+              f"{compressed_random / 1e6:.1f} MB/s compressed")
+
+
+if __name__ == "__main__":
+    main()
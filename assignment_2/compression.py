@@ -0,0 +1,84 @@
+import zlib
+from typing import List
+
+import constants
+from custom_exceptions import CompressionException
+
+
+def compress_block(block: bytes, level: int = constants.COMPRESSION_LEVEL) -> bytes:
+    """ Compresses a block of the stream on its own, without the state of any other
+    block, so it can be decompressed from its own packets alone.
+
+    The block is framed as the method (1 byte), the length of the data that follows
+    (4 bytes) and the data: the zlib-compressed block, or the block as is if it does
+    not compress. Whether it compresses is first checked on its first
+    constants.COMPRESSION_PROBE_SIZE bytes, so already compressed or random data
+    costs little to send.
+
+    Args:
+        block: Up to constants.COMPRESSION_BLOCK_SIZE bytes of the stream.
+        level: zlib compression level.
+
+    Returns:
+        The framed block.
+    """
+    probe = block[:constants.COMPRESSION_PROBE_SIZE]
+    if len(zlib.compress(probe, 1)) >= len(probe):
+        data = block
+    else:
+        data = zlib.compress(block, level)
+    method = constants.COMPRESSION_ZLIB
+    if len(data) >= len(block):
+        data = bytes(block)
+        method = constants.COMPRESSION_STORED
+    return (method.to_bytes(length=1, byteorder="big") +
+            len(data).to_bytes(length=4, byteorder="big") + data)
+
+
+class BlockDecoder(object):
+    """ Rebuilds the stream from the framed blocks of a compressed transfer.
+
+    Feed it the payloads of the data packets in order. Every block starts at the
+    start of a packet, so only the block a packet belongs to waits for it.
+    """
+
+    def __init__(self):
+        # Received bytes of the block being rebuilt.
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """ Adds the payload of the next data packet.
+
+        Args:
+            data: The payload.
+
+        Returns:
+            The decompressed blocks the payload completed, in order.
+
+        Raises:
+            CompressionException: If a block cannot be decompressed.
+        """
+        self.buffer += data
+        blocks = []
+        while len(self.buffer) >= constants.COMPRESSION_HEADER_SIZE:
+            length = int.from_bytes(
+                self.buffer[1:constants.COMPRESSION_HEADER_SIZE], byteorder="big")
+            end = constants.COMPRESSION_HEADER_SIZE + length
+            if len(self.buffer) < end:
+                break
+            method = self.buffer[0]
+            block = bytes(self.buffer[constants.COMPRESSION_HEADER_SIZE:end])
+            del self.buffer[:end]
+            if method == constants.COMPRESSION_ZLIB:
+                try:
+                    block = zlib.decompress(block)
+                except zlib.error as e:
+                    raise CompressionException(f"Corrupt block: {e}")
+            elif method != constants.COMPRESSION_STORED:
+                raise CompressionException(f"Unknown compression method: {method}")
+            blocks.append(block)
+        return blocks
+
+    def pending(self) -> int:
+        """ Returns the number of bytes received of a block that is not complete."""
+        return len(self.buffer)
@@ -1,19 +1,79 @@
 TYPE_ACK = 0
 TYPE_PACKET = 1
 TYPE_EOT = 2
+TYPE_PARITY = 3
+TYPE_RESUME = 4
+TYPE_SYN = 5
+TYPE_ABORT = 6
 
-BUFFER_SIZE = 500
+FLAG_SACK = 1
+FLAG_CHECKSUM = 2
+FLAG_COMPRESSION = 4
+FLAG_ARCHIVE = 8
+
+HEADER_SIZE = 16
+BUFFER_SIZE = 496
 PACKET_DATA_SIZE = 512
-ACK_BUFFER_SIZE = 12
+MAX_DATAGRAM_SIZE = 65507
+MAX_PAYLOAD_SIZE = MAX_DATAGRAM_SIZE - HEADER_SIZE
+SOCKET_BUFFER_SIZE = 1 << 22
+UDP_SEGMENT = 103
+UDP_GRO = 104
+GSO_MAX_SEGMENTS = 64
+GRO_BUFFER_SIZE = 65535
+MAX_SACK_BLOCKS = 4
+ACK_BUFFER_SIZE = HEADER_SIZE + 8 * MAX_SACK_BLOCKS
+WRITE_BUFFER_SIZE = 1 << 20
+READ_AHEAD_BLOCK_SIZE = 1 << 20
+READ_AHEAD_QUEUE_SIZE = 4
+COMPRESSION_BLOCK_SIZE = 1 << 16
+COMPRESSION_LEVEL = 6
+COMPRESSION_PROBE_SIZE = 4096
+COMPRESSION_HEADER_SIZE = 5
+COMPRESSION_STORED = 0
+COMPRESSION_ZLIB = 1
+CHECKPOINT_SUFFIX = ".checkpoint"
+ARCHIVE_NAME_LENGTH_SIZE = 2
+ARCHIVE_FILE_SIZE_SIZE = 8
 WINDOW_SIZE = 14
-PROCESS_WAIT = 0.0005
+MAX_WINDOW_SIZE = 1024
+RECEIVE_BATCH_SIZE = 64
+ACK_EVERY = 2
+ACK_DELAY = 0.005
+ABORT_LINGER = 5
+SACK_ENABLED = True
+FEC_GROUP_SIZE = 0
+FEC_HEADER_SIZE = 4
+PACING_RATE = 0
+PACING_BURST = 2 * PACKET_DATA_SIZE
+RTT_ALPHA = 0.125
 
 TIMEOUT_VALUE = 100
+TIMER_RESOLUTION = 0.001
+TIMER_WHEEL_SLOTS = 512
 
 SEQUENCE_LOG_NUM = 60
 ACK_LOG_NUM = 70
 TIME_LOG_NUM = 80
 ARRIVAL_LOG_NUM = 90
+LOG_FLUSH_INTERVAL = 0.1
+SENDER_STATS_LOG = "sender.stats.json"
+RECEIVER_STATS_LOG = "receiver.stats.json"
 
 MODULO_RANGE = 32
+SEQUENCE_BITS = 16
+MIN_SEQUENCE_BITS = 12
+MAX_SEQUENCE_BITS = 32
+
+EMULATOR_BUFFER_SIZE = 65535
+EMULATOR_QUEUE_SIZE = 32
+EMULATOR_REORDER_DELAY = 10
+
+SERVER_IDLE_TIMEOUT = 30
+SERVER_LINGER = 5
+SERVER_WRITE_BUFFER_SIZE = 1 << 16
+
+REPORT_BASE_PORT = 40000
+REPORT_RUN_TIMEOUT = 300
+REPORT_STARTUP_WAIT = 0.5
 PRINT_INFO=False
@@ -0,0 +1,30 @@
+class CorruptPacketException(Exception):
+    """ This exception is raised when a received packet's checksum does not match its
+    contents.
+
+    """
+    pass
+
+
+class CompressionException(Exception):
+    """ This exception is raised when a block of a compressed transfer cannot be
+    decompressed.
+
+    """
+    pass
+
+
+class ArchiveException(Exception):
+    """ This exception is raised when a file being sent as part of an archive changes
+    size while it is read.
+
+    """
+    pass
+
+
+class TransferAbortedException(Exception):
+    """ This exception is raised when the receiver abandons a transfer it cannot
+    complete.
+
+    """
+    pass
@@ -0,0 +1,241 @@
+from argparse import ArgumentParser
+from collections import deque
+import heapq
+import random
+import selectors
+from socket import socket, AF_INET, SOCK_DGRAM
+import time
+from typing import Tuple
+
+import constants
+
+
+class Link(object):
+    """ One direction of the emulated network.
+
+    Every random decision for the n-th packet through a link is drawn from the link's
+    own seeded generator, so a given seed produces the same losses, delays,
+    duplicates and reorderings regardless of how the two directions interleave.
+    """
+
+    def __init__(self, name: str, sock: socket, dest: Tuple[str, int], seed: int,
+                 max_delay: float, p_discard: float, p_duplicate: float = 0,
+                 p_reorder: float = 0, reorder_delay: float = 0, bandwidth: float = 0,
+                 queue_size: int = constants.EMULATOR_QUEUE_SIZE):
+        """ Constructor.
+
+        Args:
+            name: Name of the direction used when printing, e.g. "forward".
+            sock: The socket packets are received on and sent from.
+            dest: A hostname, port tuple to deliver packets to.
+            seed: Seed of the link's random generator.
+            max_delay: Maximum propagation delay in seconds, drawn uniformly.
+            p_discard: Probability a packet is discarded.
+            p_duplicate: Probability a packet is delivered twice.
+            p_reorder: Probability a packet is held back an extra reorder_delay.
+            reorder_delay: Extra delay in seconds for reordered packets.
+            bandwidth: Bytes per second the link can carry, zero for unlimited.
+            queue_size: Packets that may wait for a bandwidth-limited link before new
+                ones are dropped.
+        """
+        self.name = name
+        self.sock = sock
+        self.dest = dest
+        self.rng = random.Random(f"{seed}-{name}")
+        self.max_delay = max_delay
+        self.p_discard = p_discard
+        self.p_duplicate = p_duplicate
+        self.p_reorder = p_reorder
+        self.reorder_delay = reorder_delay
+        self.bandwidth = bandwidth
+        self.queue_size = queue_size
+        # Times queued packets finish serializing onto the link, in order.
+        self.queue = deque()
+
+    def schedule(self, data: bytes, now: float) -> list:
+        """ Decides the fate of a received packet.
+
+        Args:
+            data: The received datagram.
+            now: The time it was received.
+
+        Returns:
+            The times, possibly none, the packet should be delivered at.
+        """
+        # Draw every decision up front so the sequence does not depend on the outcome.
+        discard = self.rng.random() < self.p_discard
+        duplicate = self.rng.random() < self.p_duplicate
+        reorder = self.rng.random() < self.p_reorder
+        delays = [self.rng.uniform(0, self.max_delay), self.rng.uniform(0, self.max_delay)]
+
+        # Like nEmulator, EOT packets are never discarded.
+        eot = int.from_bytes(data[2:4], byteorder="big") == constants.TYPE_EOT
+        if discard and not eot:
+            return []
+
+        departure = now
+        if self.bandwidth > 0:
+            while self.queue and self.queue[0] <= now:
+                self.queue.popleft()
+            if len(self.queue) >= self.queue_size and not eot:
+                return []
+            departure = max(now, self.queue[-1] if self.queue else now)
+            departure += len(data) / self.bandwidth
+            self.queue.append(departure)
+
+        if reorder:
+            departure += self.reorder_delay
+
+        deliveries = [departure + delays[0]]
+        if duplicate:
+            deliveries.append(departure + delays[1])
+        return deliveries
+
+
+class Emulator(object):
+    """ A UDP network emulator between a sender and a receiver.
+
+    Takes the same arguments as nEmulator-linux386: data from the sender is forwarded
+    to the receiver and ACKs from the receiver are forwarded to the sender.
+    """
+
+    def __init__(self, forward_port: int, receiver_addr: str, receiver_port: int,
+                 backward_port: int, sender_addr: str, sender_port: int,
+                 max_delay: int, p_discard: float, verbose: bool = False,
+                 seed: int = 0, p_duplicate: float = 0, p_reorder: float = 0,
+                 reorder_delay: int = constants.EMULATOR_REORDER_DELAY,
+                 bandwidth: float = 0, queue_size: int = constants.EMULATOR_QUEUE_SIZE):
+        """ Constructor.
+
+        Args:
+            forward_port: The port to receive data from the sender on.
+            receiver_addr: The hostname of the receiver.
+            receiver_port: The port the receiver receives data on.
+            backward_port: The port to receive ACKs from the receiver on.
+            sender_addr: The hostname of the sender.
+            sender_port: The port the sender receives ACKs on.
+            max_delay: Maximum delay of the link in milliseconds.
+            p_discard: Probability a packet is discarded.
+            verbose: If True, prints every packet received, discarded and sent.
+            seed: Seed for every random decision.
+            p_duplicate: Probability a packet is delivered twice.
+            p_reorder: Probability a packet is held back an extra reorder_delay.
+            reorder_delay: Extra delay in milliseconds for reordered packets.
+            bandwidth: Bytes per second each direction can carry, zero for unlimited.
+            queue_size: Packets that may wait for a bandwidth-limited link.
+        """
+        self.verbose = verbose
+        self.links = []
+        for name, port, dest in [("forward", forward_port, (receiver_addr, receiver_port)),
+                                 ("backward", backward_port, (sender_addr, sender_port))]:
+            sock = socket(AF_INET, SOCK_DGRAM)
+            sock.bind(("", port))
+            sock.setblocking(False)
+            self.links.append(Link(name, sock, dest, seed, max_delay / 1000, p_discard,
+                                   p_duplicate, p_reorder, reorder_delay / 1000,
+                                   bandwidth, queue_size))
+
+        # Heap of (delivery time, counter, link, data) waiting to be delivered.
+        self.pending = []
+        self.counter = 0
+
+    def print_packet(self, link: Link, event: str, data: bytes):
+        if self.verbose:
+            seq_num = int.from_bytes(data[4:8], byteorder="big")
+            print(f"---> {link.name} direction: {event} packet {seq_num}")
+
+    def receive(self, link: Link):
+        """ Drains the link's socket, scheduling every packet received.
+
+        Args:
+            link: The link whose socket is readable.
+        """
+        while True:
+            try:
+                data, _ = link.sock.recvfrom(constants.EMULATOR_BUFFER_SIZE)
+            except BlockingIOError:
+                return
+            self.print_packet(link, "received", data)
+            deliveries = link.schedule(data, time.monotonic())
+            if not deliveries:
+                self.print_packet(link, "discarded", data)
+            for delivery in deliveries:
+                heapq.heappush(self.pending, (delivery, self.counter, link, data))
+                self.counter += 1
+
+    def deliver(self, now: float):
+        """ Sends every packet whose delivery time has passed.
+
+        Args:
+            now: The current time.
+        """
+        while self.pending and self.pending[0][0] <= now:
+            _, _, link, data = heapq.heappop(self.pending)
+            link.sock.sendto(data, link.dest)
+            self.print_packet(link, "send", data)
+
+    def run(self):
+        """ Forwards packets in both directions until interrupted."""
+        selector = selectors.DefaultSelector()
+        for link in self.links:
+            selector.register(link.sock, selectors.EVENT_READ, link)
+
+        while True:
+            timeout = None
+            if self.pending:
+                timeout = max(0.0, self.pending[0][0] - time.monotonic())
+            for key, _ in selector.select(timeout):
+                self.receive(key.data)
+            self.deliver(time.monotonic())
+
+
+def main():
+    # Parse arguments
+    parser = ArgumentParser(description='Emulator')
+    parser.add_argument("forward_port", type=int,
+                        help="The port to receive data from the sender on.")
+    parser.add_argument("receiver_addr", type=str,
+                        help="The hostname of the receiver.")
+    parser.add_argument("receiver_port", type=int,
+                        help="The port the receiver receives data on.")
+    parser.add_argument("backward_port", type=int,
+                        help="The port to receive ACKs from the receiver on.")
+    parser.add_argument("sender_addr", type=str,
+                        help="The hostname of the sender.")
+    parser.add_argument("sender_port", type=int,
+                        help="The port the sender receives ACKs on.")
+    parser.add_argument("max_delay", type=int,
+                        help="Maximum delay of the link in milliseconds.")
+    parser.add_argument("p_discard", type=float,
+                        help="Probability a packet is discarded.")
+    parser.add_argument("verbose", type=int, nargs="?", default=0,
+                        help="If 1, prints every packet received, discarded and sent.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for every random decision.")
+    parser.add_argument("--duplicate", type=float, default=0,
+                        help="Probability a packet is delivered twice.")
+    parser.add_argument("--reorder", type=float, default=0,
+                        help="Probability a packet is held back by --reorder-delay.")
+    parser.add_argument("--reorder-delay", type=int,
+                        default=constants.EMULATOR_REORDER_DELAY,
+                        help="Extra delay in milliseconds for reordered packets.")
+    parser.add_argument("--bandwidth", type=float, default=0,
+                        help="Bytes per second each direction can carry (0 is unlimited).")
+    parser.add_argument("--queue-size", type=int, default=constants.EMULATOR_QUEUE_SIZE,
+                        help="Packets that may wait for a bandwidth-limited link.")
+    args = parser.parse_args()
+
+    # Run Emulator
+    emulator = Emulator(args.forward_port, args.receiver_addr, args.receiver_port,
+                        args.backward_port, args.sender_addr, args.sender_port,
+                        args.max_delay, args.p_discard, bool(args.verbose), args.seed,
+                        args.duplicate, args.reorder, args.reorder_delay,
+                        args.bandwidth, args.queue_size)
+    try:
+        emulator.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+from argparse import ArgumentParser
+import asyncio
+import time
+from typing import List, Tuple
+
+from packet import packet
+
+import constants
+from custom_exceptions import CorruptPacketException, TransferAbortedException
+from async_sender import AsyncSender
+from handshake import ConnectionParameters
+from readahead import PacketReader
+from sender import add_sender_arguments, logger
+from stats import SenderStats
+from timers import Timer
+
+
+class Destination(asyncio.DatagramProtocol):
+    """ One receiver of a fan-out transfer.
+
+    Every receiver sends its ACKs to its own port, so each has its own socket, window,
+    retransmissions and EOT, while the packets in every window are the same.
+    """
+
+    def __init__(self, sender: "FanoutSender", hostname: str, data_port: int,
+                 ack_port: int):
+        """ Constructor.
+
+        Args:
+            sender: The fan-out sender the receiver belongs to.
+            hostname: The hostname of the receiver, or of an emulator in front of it.
+            data_port: The port to send the receiver data.
+            ack_port: The port to receive the receiver's acks on.
+        """
+        self.sender = sender
+        self.hostname = hostname
+        self.data_port = data_port
+        self.ack_port = ack_port
+        self.transport = None
+        self.window = None
+        self.next_seq_num = 0
+        self.confirmed = None
+        self.eot_sent = False
+        self.done = None
+        self.dropped = False
+        # Runs while the receiver holds back the others, see FanoutSender.drop_after.
+        self.blocked = Timer(sender.drop_after)
+
+    def get_addr(self) -> Tuple[str, int]:
+        """ Returns the address packets are sent to."""
+        return self.hostname, self.data_port
+
+    def __str__(self) -> str:
+        return f"{self.hostname}:{self.data_port}"
+
+    def send_syn(self):
+        """ Sends a SYN proposing the transfer's settings.
+        """
+        self.transport.sendto(
+            self.sender.get_proposal().create_syn(
+                self.sender.connection_id).get_udp_data(), self.get_addr())
+        logger.log(f"Sent SYN to {self}.")
+
+    def send_EOT(self):
+        """ Sends an EOT packet.
+        """
+        self.transport.sendto(
+            packet.create_eot(self.window.seq_number,
+                              self.sender.connection_id).get_udp_data(),
+            self.get_addr())
+        logger.log(f"Sent EOT to {self} with: {self.window.seq_number}.")
+
+    def has_room(self) -> bool:
+        """ Returns True if the window may take the next packet now. False,
+        otherwise.
+        """
+        return not self.window.has_pending_resend() and not self.window.is_full() and \
+            self.window.time_until_send() <= 0
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        try:
+            p = packet.parse_udp_data(data)
+        except (TypeError, CorruptPacketException) as e:
+            logger.log(f"Received data that could not be processed: {e}.")
+            return
+
+        if p.connection_id != self.sender.connection_id or self.dropped:
+            logger.log(f"Ignored packet for connection: {p.connection_id}")
+            return
+
+        if p.type == constants.TYPE_ACK:
+            logger.log(f"Received ack from {self} with seq: {p.seq_num}")
+            # ACKs are cumulative for the last in-order packet received.
+            self.window.handle_ack((p.seq_num + 1) % self.window.modulo,
+                                   p.get_sack_blocks())
+            self.next_seq_num = self.window.base_number
+            self.sender.update_delivered()
+            self.sender.send()
+
+        elif p.type == constants.TYPE_SYN:
+            if self.confirmed is not None and not self.confirmed.done():
+                self.confirmed.set_result(ConnectionParameters.parse_syn(p))
+
+        elif p.type == constants.TYPE_EOT:
+            logger.log(f"Received EOT from {self}.")
+            if not self.done.done():
+                self.done.set_result(None)
+            self.sender.send()
+
+        elif p.type == constants.TYPE_ABORT:
+            logger.log(f"Received ABORT from {self}.")
+            self.sender.abort(TransferAbortedException(
+                f"Receiver {self} aborted the transfer."))
+
+    def error_received(self, exc: Exception):
+        logger.log(f"Socket error: {exc}.")
+
+
+class FanoutSender(AsyncSender):
+    """ Sends one file to several receivers at once.
+
+    The file is read and encoded into packets once, and each packet is added to every
+    receiver's window, so reading and encoding cost the same however many receivers
+    there are. A packet is only read once every receiver's window has room for it, so
+    the transfer advances at the pace of the slowest receiver, unless receivers that
+    hold back the others are dropped.
+    """
+
+    def __init__(self, hostname: str, receivers: List[Tuple[str, int, int]],
+                 filename, drop_after: float = 0, **kwargs):
+        """ Constructor. Takes the same keyword arguments as Sender, except resume.
+
+        Args:
+            hostname: The hostname to receive acks on.
+            receivers: A (hostname, data port, ack port) tuple for every receiver. Each
+                receiver must send its acks to a different port.
+            filename: The name of the file to transmit, or a list of files and
+                directories to transmit in one session as an archive.
+            drop_after: If positive, a receiver is dropped if it has not answered the
+                SYN within this many seconds, or once it has held back the others for
+                them: its window was full while another's had room, or it had not
+                finished while another had.
+        """
+        if kwargs.get("resume"):
+            raise ValueError("Resuming is not supported when sending to several "
+                             "receivers.")
+        if len({ack_port for _, _, ack_port in receivers}) < len(receivers):
+            raise ValueError("Every receiver must send its acks to a different port.")
+        super().__init__(hostname, None, None, filename, **kwargs)
+        self.drop_after = drop_after
+        self.destinations = [Destination(self, *receiver) for receiver in receivers]
+        # Receivers that have not been dropped.
+        self.active = list(self.destinations)
+
+    async def handshake(self) -> ConnectionParameters:
+        """ Proposes the transfer's settings to every receiver, resending the SYN to
+        those that have not answered whenever the timeout expires. If drop_after is
+        positive, the receivers that have not answered within it are dropped.
+
+        Returns:
+            The settings every remaining receiver confirmed.
+
+        Raises:
+            TimeoutError: If every receiver was dropped.
+        """
+        for d in self.destinations:
+            d.confirmed = self.loop.create_future()
+        deadline = Timer(self.drop_after)
+        deadline.reset()
+        pending = self.destinations
+        while pending:
+            if self.drop_after > 0 and deadline.expired():
+                for d in pending:
+                    self.drop(d, f"it did not answer the SYN in {self.drop_after} s")
+                break
+            for d in pending:
+                d.send_syn()
+            timeout = constants.TIMEOUT_VALUE / 1000
+            if self.drop_after > 0:
+                timeout = min(timeout, deadline.time_until())
+            await asyncio.wait([d.confirmed for d in pending], timeout=timeout)
+            pending = [d for d in pending if not d.confirmed.done()]
+
+        if not self.active:
+            raise TimeoutError("No receiver answered the SYN.")
+        parameters = [d.confirmed.result() for d in self.active]
+        # Every window holds the same packets, so the receivers must agree.
+        if any(p.to_dict() != parameters[0].to_dict() for p in parameters):
+            raise ValueError(f"Receivers confirmed different settings: "
+                             f"{[p.to_dict() for p in parameters]}")
+        return parameters[0]
+
+    def create_reader(self, file) -> PacketReader:
+        return PacketReader(file, self.payload_size, 0, self.parameters.modulo,
+                            self.connection_id,
+                            self.parameters.has(constants.FLAG_CHECKSUM),
+                            background=self.read_ahead, use_mmap=self.use_mmap,
+                            compress=self.parameters.has(constants.FLAG_COMPRESSION))
+
+    def drop(self, destination: Destination, reason: str):
+        """ Stops sending to a receiver.
+
+        Args:
+            destination: The receiver to drop.
+            reason: Why it is dropped, for the log.
+        """
+        destination.dropped = True
+        self.active.remove(destination)
+        destination.blocked.cancel()
+        self.stats.receivers_dropped.append(str(destination))
+        logger.log(f"Dropped {destination}, {reason}.")
+
+    def update_delivered(self):
+        """ Records the bytes of the file every receiver still sent to has
+        acknowledged so far.
+        """
+        if self.active:
+            self.stats.bytes_delivered = min(d.window.bytes_acked for d in self.active)
+
+    def drop_laggards(self):
+        """ Drops the receivers that have held back the others for too long.
+        """
+        if self.drop_after <= 0:
+            return
+        active = list(self.active)
+        if self.reading:
+            blocked = [d for d in active if not d.has_room()]
+        else:
+            blocked = [d for d in active if not d.done.done()]
+        if len(blocked) == len(active):
+            # Nobody is waiting on anybody else.
+            blocked = []
+        for d in active:
+            if d not in blocked:
+                d.blocked.cancel()
+            elif not d.blocked.is_armed():
+                d.blocked.reset()
+            elif d.blocked.expired():
+                self.drop(d, f"it held back the others for {self.drop_after} s")
+                self.update_delivered()
+
+    def abort(self, error: Exception):
+        """ Ends the transfer to every receiver, raising the error from run_async.
+
+        Args:
+            error: Why the transfer cannot go on.
+        """
+        for d in self.destinations:
+            if not d.done.done():
+                d.done.cancel()
+        super().abort(error)
+
+    def end_of_file(self):
+        """ Called once every packet of the file has been added to the windows.
+        """
+        for d in self.active:
+            d.window.flush_parity(d.get_addr())
+        logger.log("Ending transmission.")
+
+    def send(self):
+        """ Sends every receiver as much as the windows and pacers allow, then the
+        EOT once every packet has been acknowledged, and re-arms the timer.
+        """
+        for d in self.active:
+            d.window.send_pending(d.get_addr())
+        self.drop_laggards()
+
+        active = self.active
+        if self.next_packet is None and self.reading:
+            self.advance()
+        while self.next_packet and active and all(d.has_room() for d in active):
+            data, udp_data, file_bytes = self.next_packet
+            for d in active:
+                d.window.add_data(data, d.get_addr(), udp_data, file_bytes)
+            self.advance()
+
+        for d in active:
+            if not self.reading and not d.eot_sent and \
+                    not d.window.has_pending_resend() and \
+                    d.window.finished(d.next_seq_num):
+                d.send_EOT()
+                d.eot_sent = True
+                d.window.reset_timer()
+
+        if all(d.done.done() for d in active) and not self.done.done():
+            logger.log("Finished sending to every receiver.")
+            self.done.set_result(None)
+            return
+
+        self.schedule()
+
+    def schedule(self):
+        """ Arms a single timer for the earliest retransmission timeout, pacer
+        releasing a packet or receiver being dropped.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+
+        active = self.active
+        delays = []
+        for d in active:
+            if d.eot_sent or d.window.outstanding():
+                delays.append(d.window.time_until_timeout())
+            if d.window.has_pending_resend():
+                delays.append(d.window.time_until_send())
+            if d.blocked.is_armed():
+                delays.append(d.blocked.time_until())
+        # The next packet waits for the last pacer to allow it, once every window has
+        # room.
+        if self.next_packet and active and all(
+                not d.window.is_full() and not d.window.has_pending_resend()
+                for d in active):
+            delays.append(max(d.window.time_until_send() for d in active))
+        self.timer = self.loop.call_later(min(delays), self.on_timer) \
+            if delays else None
+
+    def on_timer(self):
+        self.timer = None
+        for d in self.active:
+            if d.window.time_until_timeout() <= 0:
+                if d.eot_sent:
+                    d.send_EOT()
+                    d.window.reset_timer()
+                elif d.window.outstanding():
+                    d.window.resend_all(d.get_addr())
+        self.send()
+
+    async def run_async(self):
+        """ Transmits the file to every receiver and waits for their EOTs, or for
+        them to be dropped.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.done = self.loop.create_future()
+        for d in self.destinations:
+            d.done = self.loop.create_future()
+            d.transport, _ = await self.loop.create_datagram_endpoint(
+                lambda d=d: d, local_addr=(self.hostname, d.ack_port))
+
+        self.stats = SenderStats()
+
+        with self.open_file() as self.file:
+            self.start = time.monotonic()
+            self.stats.start()
+            self.configure(await self.handshake())
+            for d in self.destinations:
+                d.window = self.create_window(d.transport.sendto)
+            with self.create_reader(self.file) as reader:
+                self.start_reading(reader)
+                self.send()
+                try:
+                    await self.done
+                finally:
+                    if self.timer is not None:
+                        self.timer.cancel()
+                    for d in self.destinations:
+                        d.transport.close()
+
+        # Log Transmission Time
+        logger.time(str(1000 * (time.monotonic() - self.start)))
+        logger.log("Done.")
+        self.stats.finish()
+        self.stats.save(self.stats_file)
+
+
+def main():
+    # Parse arguments
+    parser = ArgumentParser(description='Fan-out Sender')
+    parser.add_argument("hostname", type=str,
+                        help="The hostname to receive ack messages on.")
+    add_sender_arguments(parser)
+    parser.add_argument("--receiver", nargs=3, action="append", required=True,
+                        metavar=("HOSTNAME", "DATA_PORT", "ACK_PORT"),
+                        help="A receiver (or emulator) to send to, the port to send it "
+                             "data and the port it sends acks to. Repeat for every "
+                             "receiver.")
+    parser.add_argument("--drop-after", type=float, default=0,
+                        help="Drop a receiver that has not answered the SYN or has held "
+                             "back the others for this many seconds (0 waits for every "
+                             "receiver).")
+    args = parser.parse_args()
+
+    # Run Sender
+    receivers = [(hostname, int(data_port), int(ack_port))
+                 for hostname, data_port, ack_port in args.receiver]
+    sender = FanoutSender(args.hostname, receivers, args.filename, args.drop_after,
+                          fec_group_size=args.fec, pacing_rate=args.pace_rate,
+                          pace_by_rtt=args.pace_rtt, stats_file=args.stats,
+                          connection_id=args.connection_id, window_size=args.window,
+                          sequence_bits=args.sequence_bits, checksum=args.checksum,
+                          mss=args.mss, read_ahead=args.read_ahead, use_mmap=args.mmap,
+                          compress=args.compress)
+    sender.run()
+
+
+if __name__ == "__main__":
+    main()
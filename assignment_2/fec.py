@@ -0,0 +1,107 @@
+from typing import List, Optional
+
+import constants
+from packet import packet
+
+
+def xor_bytes(a: bytes, b: bytes) -> bytes:
+    """ XORs two byte strings, padding the shorter one with zeros.
+
+    Args:
+        a: First byte string.
+        b: Second byte string.
+
+    Returns:
+        A byte string as long as the longer input.
+    """
+    length = max(len(a), len(b))
+    return (int.from_bytes(a.ljust(length, b"\0"), byteorder="big") ^
+            int.from_bytes(b.ljust(length, b"\0"), byteorder="big")).to_bytes(
+        length, byteorder="big")
+
+
+class ParityEncoder(object):
+    """ Accumulates XOR parity over groups of consecutively sent data packets.
+
+    A parity packet's sequence number is that of the first packet in its group. Its
+    data is the number of packets in the group (2 bytes), the XOR of their lengths
+    (2 bytes) and the XOR of their payloads, which lets the receiver rebuild any one
+    packet of the group from the others.
+    """
+
+    def __init__(self, group_size: int):
+        """ Constructor.
+
+        Args:
+            group_size: Number of data packets covered by each parity packet.
+        """
+        self.group_size = group_size
+        self._reset()
+
+    def _reset(self):
+        self.start = None
+        self.count = 0
+        self.lengths = 0
+        self.parity = b""
+
+    def add(self, seq_num: int, data: bytes) -> Optional[packet]:
+        """ Adds a sent data packet to the current group.
+
+        Args:
+            seq_num: The sequence number of the data packet.
+            data: The payload of the data packet.
+
+        Returns:
+            The parity packet for the group if it is now complete, None otherwise.
+        """
+        if self.start is None:
+            self.start = seq_num
+        self.count += 1
+        self.lengths ^= len(data)
+        self.parity = xor_bytes(self.parity, data)
+        if self.count >= self.group_size:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[packet]:
+        """ Ends the current group early, e.g. at the end of the file.
+
+        Returns:
+            The parity packet for the group, None if the group is empty.
+        """
+        if self.start is None:
+            return None
+        data = (self.count.to_bytes(length=2, byteorder="big") +
+                self.lengths.to_bytes(length=2, byteorder="big") + self.parity)
+        parity = packet.create_parity(self.start, data)
+        self._reset()
+        return parity
+
+
+def get_group(parity: packet, modulo: int = constants.MODULO_RANGE) -> List[int]:
+    """ Returns the sequence numbers covered by a parity packet.
+
+    Args:
+        parity: The parity packet of the group.
+        modulo: Number at which sequence numbers wrap.
+    """
+    count = int.from_bytes(parity.data[0:2], byteorder="big")
+    return [(parity.seq_num + i) % modulo for i in range(count)]
+
+
+def recover(parity: packet, members: List[bytes]) -> bytes:
+    """ Rebuilds the single missing packet of a parity group.
+
+    Args:
+        parity: The parity packet of the group.
+        members: The payloads of every other packet in the group.
+
+    Returns:
+        The payload of the missing packet.
+    """
+    length = int.from_bytes(parity.data[2:4], byteorder="big")
+    data = parity.data[constants.FEC_HEADER_SIZE:]
+    for member in members:
+        length ^= len(member)
+        data = xor_bytes(data, member)
+    return data[:length]
@@ -0,0 +1,144 @@
+from socket import socket, IPPROTO_UDP, CMSG_SPACE
+import struct
+from typing import List, Optional, Tuple
+
+import constants
+
+
+def enable_gro(sock: socket) -> bool:
+    """ Asks the kernel to coalesce datagrams arriving on a socket (UDP GRO), so that
+    several can be read with one receive_segments call.
+
+    Args:
+        sock: The UDP socket to receive on.
+
+    Returns:
+        True if GRO was enabled. False if the kernel does not support it, in which
+        case every datagram still arrives on its own.
+    """
+    try:
+        sock.setsockopt(IPPROTO_UDP, constants.UDP_GRO, 1)
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def receive_segments(sock: socket) -> Tuple[List[bytes], Tuple[str, int]]:
+    """ Receives the next datagram, split back into the datagrams it was coalesced
+    from if GRO is enabled on the socket.
+
+    Args:
+        sock: The UDP socket to receive from.
+
+    Returns:
+        A tuple consisting of:
+            * The datagrams, in the order they were sent.
+            * The address they were received from.
+    """
+    data, ancillary, _, addr = sock.recvmsg(constants.GRO_BUFFER_SIZE,
+                                            CMSG_SPACE(struct.calcsize("i")))
+    size = None
+    for level, kind, value in ancillary:
+        if level == IPPROTO_UDP and kind == constants.UDP_GRO:
+            size = struct.unpack("i", value[:struct.calcsize("i")])[0]
+    if not size or size >= len(data):
+        return [data], addr
+    # Every datagram but the last one has the segment size.
+    return [data[start:start + size] for start in range(0, len(data), size)], addr
+
+
+class BatchSender(object):
+    """ Sends packets to a socket in batches, using UDP GSO where the kernel supports
+    it.
+
+    Consecutive packets of the same size to the same address are collected and sent
+    with a single sendmsg, which the kernel splits back into one datagram per packet
+    (UDP_SEGMENT). A shorter packet may end a batch. If the kernel rejects a batch,
+    it and every later packet are sent one sendto at a time.
+    """
+
+    def __init__(self, sock: socket, max_segments: int = constants.GSO_MAX_SEGMENTS):
+        """ Constructor.
+
+        Args:
+            sock: The UDP socket to send from.
+            max_segments: Maximum number of packets to send in one batch.
+        """
+        self.socket = sock
+        self.max_segments = max_segments
+        self.enabled = True
+        self.packets = []
+        self.addr = None
+        self.bytes = 0
+        # Number of packets handed to the socket so far, those in the batch excluded.
+        self.sent = 0
+        # Size of every packet in the batch, except maybe the last.
+        self.segment_size = None
+
+    def sendto(self, udp_data: bytes, addr: Tuple[str, int]):
+        """ Adds a packet to the batch, sending the batch first if the packet cannot
+        join it. Call flush to send the batch.
+
+        Args:
+            udp_data: The encoded packet.
+            addr: A hostname, port tuple to send it to.
+        """
+        if not self.enabled:
+            self.socket.sendto(udp_data, addr)
+            self.sent += 1
+            return
+
+        if self.packets and (
+                addr != self.addr or len(udp_data) > self.segment_size or
+                len(self.packets[-1]) < self.segment_size or
+                self.bytes + len(udp_data) > constants.MAX_DATAGRAM_SIZE):
+            self.flush()
+        if not self.packets:
+            self.addr = addr
+            self.segment_size = len(udp_data)
+        self.packets.append(udp_data)
+        self.bytes += len(udp_data)
+        if len(self.packets) >= self.max_segments:
+            self.flush()
+
+    def flush(self):
+        """ Sends the batch, if there is one.
+        """
+        packets, addr, segment_size = self.packets, self.addr, self.segment_size
+        self.packets = []
+        self.bytes = 0
+        if len(packets) == 1:
+            self.socket.sendto(packets[0], addr)
+        elif packets:
+            self._send_segmented(packets, addr, segment_size)
+        self.sent += len(packets)
+
+    def _send_segmented(self, packets: List[bytes], addr: Tuple[str, int],
+                        segment_size: int):
+        try:
+            self.socket.sendmsg(
+                [b"".join(packets)],
+                [(IPPROTO_UDP, constants.UDP_SEGMENT, struct.pack("H", segment_size))],
+                0, addr)
+        except OSError:
+            # Not supported by the kernel or the route, e.g. a segment size above the
+            # MTU.
+            self.enabled = False
+            for udp_data in packets:
+                self.socket.sendto(udp_data, addr)
+
+
+def create_batch_sender(sock: socket) -> Optional[BatchSender]:
+    """ Returns a BatchSender for a socket, or None if the kernel does not support
+    UDP GSO.
+
+    Args:
+        sock: The UDP socket to send from.
+    """
+    try:
+        # Sets a default segment size, only to check the option is supported.
+        sock.setsockopt(IPPROTO_UDP, constants.UDP_SEGMENT, constants.PACKET_DATA_SIZE)
+        sock.setsockopt(IPPROTO_UDP, constants.UDP_SEGMENT, 0)
+    except (OSError, AttributeError):
+        return None
+    return BatchSender(sock)
@@ -0,0 +1,94 @@
+from typing import Dict
+
+import constants
+from packet import packet
+
+
+class ConnectionParameters(object):
+    """ Settings a sender and receiver agree on before any data is sent.
+
+    The sender proposes them in a SYN packet and the receiver answers with a SYN
+    holding the settings both ends support: the smaller window, payload size and
+    sequence width, and the feature flags both have set. FLAG_ARCHIVE is not a
+    feature but a mode both ends must share, so the receiver answers with its own.
+
+    The data of a SYN is the window size (4 bytes), the payload size (4 bytes), the
+    number of bits in a sequence number (2 bytes) and the feature flags (2 bytes).
+    """
+
+    def __init__(self, window_size: int = constants.WINDOW_SIZE,
+                 mss: int = constants.BUFFER_SIZE,
+                 sequence_bits: int = constants.MODULO_RANGE.bit_length() - 1,
+                 flags: int = constants.FLAG_SACK | constants.FLAG_CHECKSUM):
+        """ Constructor. The defaults are the settings used before the handshake
+        existed, assumed for a sender that starts sending data without one.
+
+        Args:
+            window_size: Maximum number of unacknowledged packets.
+            mss: Maximum number of bytes of data in a packet.
+            sequence_bits: Sequence numbers wrap at 2 ** sequence_bits.
+            flags: constants.FLAG_* features in use.
+        """
+        self.window_size = window_size
+        self.mss = mss
+        self.sequence_bits = sequence_bits
+        self.flags = flags
+
+    @property
+    def modulo(self) -> int:
+        """ Returns the number at which sequence numbers wrap."""
+        return 1 << self.sequence_bits
+
+    def has(self, flag: int) -> bool:
+        """ Returns True if a constants.FLAG_* feature is in use. False, otherwise."""
+        return bool(self.flags & flag)
+
+    def negotiate(self, proposal: "ConnectionParameters") -> "ConnectionParameters":
+        """ Returns the settings to confirm to a sender, given the most this end
+        supports.
+
+        The window is also limited to less than half the sequence space, so the
+        oldest ACK the sender can still receive never names a packet in flight, and
+        the packets of one window are never mistaken for those of the next. Packets
+        or ACKs delayed by more than a wrap of the sequence numbers can still be, so
+        sequence numbers have at least constants.MIN_SEQUENCE_BITS bits.
+
+        Args:
+            proposal: The settings the sender proposed.
+        """
+        sequence_bits = max(constants.MIN_SEQUENCE_BITS,
+                            min(proposal.sequence_bits, self.sequence_bits))
+        window_size = max(1, min(proposal.window_size, self.window_size,
+                                 (1 << sequence_bits) // 2 - 1))
+        flags = (proposal.flags & self.flags & ~constants.FLAG_ARCHIVE) | \
+            (self.flags & constants.FLAG_ARCHIVE)
+        return ConnectionParameters(window_size, max(1, min(proposal.mss, self.mss)),
+                                    sequence_bits, flags)
+
+    def create_syn(self, connection_id: int = 0) -> packet:
+        """ Returns a SYN packet carrying the settings."""
+        return packet.create_syn(
+            self.window_size.to_bytes(length=4, byteorder="big") +
+            self.mss.to_bytes(length=4, byteorder="big") +
+            self.sequence_bits.to_bytes(length=2, byteorder="big") +
+            self.flags.to_bytes(length=2, byteorder="big"), connection_id)
+
+    @staticmethod
+    def parse_syn(syn: packet) -> "ConnectionParameters":
+        """ Returns the settings carried by a SYN packet."""
+        return ConnectionParameters(int.from_bytes(syn.data[0:4], byteorder="big"),
+                                    int.from_bytes(syn.data[4:8], byteorder="big"),
+                                    int.from_bytes(syn.data[8:10], byteorder="big"),
+                                    int.from_bytes(syn.data[10:12], byteorder="big"))
+
+    def to_dict(self) -> Dict:
+        """ Returns the settings as a JSON serializable dict."""
+        return {
+            "window_size": self.window_size,
+            "mss": self.mss,
+            "sequence_bits": self.sequence_bits,
+            "sack": self.has(constants.FLAG_SACK),
+            "checksum": self.has(constants.FLAG_CHECKSUM),
+            "compression": self.has(constants.FLAG_COMPRESSION),
+            "archive": self.has(constants.FLAG_ARCHIVE),
+        }
@@ -1,5 +1,63 @@
+import atexit
+from collections import deque
 import logging
 import sys
+from threading import Event, Thread
+
+import constants
+
+
+class BackgroundLogFile(object):
+    """ Appends one line per event to a file from a background thread.
+
+    Recording an event only appends it to a deque, keeping file writes and formatting
+    off the sender/receiver hot path. Lines match logging.FileHandler's default
+    output: str(msg) followed by a newline.
+    """
+
+    def __init__(self, filename: str,
+                 flush_interval: float = constants.LOG_FLUSH_INTERVAL):
+        """ Constructor.
+
+        Args:
+            filename: The file to append lines to.
+            flush_interval: Seconds between background writes.
+        """
+        self._events = deque()
+        self._file = open(filename, "a")
+        self._flush_interval = flush_interval
+        self._closed = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, msg):
+        """ Records an event to be written as a line."""
+        self._events.append(msg)
+
+    def _drain(self):
+        lines = []
+        try:
+            while True:
+                lines.append(f"{self._events.popleft()}\n")
+        except IndexError:
+            pass
+        if lines:
+            self._file.write("".join(lines))
+            self._file.flush()
+
+    def _run(self):
+        while not self._closed.wait(self._flush_interval):
+            self._drain()
+
+    def close(self):
+        """ Writes all remaining events and closes the file."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        self._drain()
+        self._file.close()
 
 
 def configure_sender_logger(name, sequence_log="seqnum.log", ack_log="ack.log",
@@ -21,25 +79,9 @@ def configure_sender_logger(name, sequence_log="seqnum.log", ack_log="ack.log",
     class SenderLogger(object):
 
         def __init__(self):
-            self._sequence = logging.getLogger(f"{name}-sequence")
-            self._ack = logging.getLogger(f"{name}-ack")
-            self._time = logging.getLogger(f"{name}-time")
-            self._sequence.setLevel(logging.INFO)
-            self._ack.setLevel(logging.INFO)
-            self._time.setLevel(logging.INFO)
-
-            # Add log file handlers
-            seq_file = logging.FileHandler(sequence_log)
-            seq_file.setLevel(logging.INFO)
-            self._sequence.addHandler(seq_file)
-
-            ack_file = logging.FileHandler(ack_log)
-            ack_file.setLevel(logging.INFO)
-            self._ack.addHandler(ack_file)
-
-            time_file = logging.FileHandler(time_log)
-            time_file.setLevel(logging.INFO)
-            self._time.addHandler(time_file)
+            self._sequence = BackgroundLogFile(sequence_log)
+            self._ack = BackgroundLogFile(ack_log)
+            self._time = BackgroundLogFile(time_log)
 
             self.stdout = info_stdout
             if info_stdout:
@@ -53,13 +95,18 @@ def configure_sender_logger(name, sequence_log="seqnum.log", ack_log="ack.log",
                 self._log.info(f"[SENDER] - {msg}")
 
         def ack(self, msg):
-            self._ack.info(msg)
+            self._ack.write(msg)
 
         def sequence(self, msg):
-            self._sequence.info(msg)
+            self._sequence.write(msg)
 
         def time(self, msg):
-            self._time.info(msg)
+            self._time.write(msg)
+
+        def close(self):
+            self._sequence.close()
+            self._ack.close()
+            self._time.close()
 
     return SenderLogger()
 
@@ -80,10 +127,7 @@ def configure_receiver_logger(name: str, arrival_log: str = "arrival.log",
     class ReceiverLogger(object):
 
         def __init__(self):
-            self._arrival = logging.Logger(f"{name}-arrival")
-            arrival_file = logging.FileHandler(arrival_log)
-            arrival_file.setLevel(logging.INFO)
-            self._arrival.addHandler(arrival_file)
+            self._arrival = BackgroundLogFile(arrival_log)
             self.stdout = info_stdout
             if info_stdout:
                 self._log = logging.Logger(f"{name}-log")
@@ -96,6 +140,9 @@ def configure_receiver_logger(name: str, arrival_log: str = "arrival.log",
                 self._log.info(f"[RECEIVER] - {msg}")
 
         def arrival(self, msg):
-            self._arrival.info(msg)
+            self._arrival.write(msg)
+
+        def close(self):
+            self._arrival.close()
 
     return ReceiverLogger()
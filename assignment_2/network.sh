@@ -7,6 +7,7 @@ sender_receive_port=10002
 max_delay=${1:-1}
 p_discard=${2:-0}
 verbose=1
+seed=${3:-0}
 
 echo "For Sender\n--------------------------------"
 echo "  Receive acks from port: ${sender_receive_port}"
@@ -18,6 +19,7 @@ echo "  Send acks to port:      ${emulator_receive_receiver_port}\n"
 
 echo "Config\n"
 echo "  Maximum Delay: ${max_delay}"
-echo "  Prob. Discard: ${p_discard}\n"
+echo "  Prob. Discard: ${p_discard}"
+echo "  Seed:          ${seed}\n"
 
-./nEmulator-linux386 $emulator_receive_sender_port $receiver_address $receiver_receive_port $emulator_receive_receiver_port $sender_address $sender_receive_port $max_delay $p_discard $verbose 
+python3 emulator.py $emulator_receive_sender_port $receiver_address $receiver_receive_port $emulator_receive_receiver_port $sender_address $sender_receive_port $max_delay $p_discard $verbose --seed $seed
@@ -0,0 +1,51 @@
+import time
+
+
+class TokenBucket(object):
+    """ Token bucket limiting the rate packets are put on the wire.
+
+    Tokens are bytes. They accumulate at `rate` bytes per second up to `burst` bytes,
+    and each packet sent consumes its size in tokens.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """ Constructor.
+
+        Args:
+            rate: Bytes per second to allow. Zero or less disables pacing.
+            burst: Maximum number of bytes that may be sent back to back.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until_available(self, size: int) -> float:
+        """ Returns the number of seconds until size bytes may be sent, zero if they
+        may be sent now.
+
+        Args:
+            size: Size of the packet in bytes.
+        """
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, (min(size, self.burst) - self.tokens) / self.rate)
+
+    def consume(self, size: int):
+        """ Records that size bytes were sent.
+
+        Args:
+            size: Size of the packet in bytes.
+        """
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens -= size
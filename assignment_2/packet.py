@@ -1,45 +1,104 @@
+import zlib
+
+from custom_exceptions import CorruptPacketException
+
 
 class packet:
-    MAX_DATA_LENGTH = 500
-    SEQ_NUM_MODULO = 32
+    # Data must fit in a UDP datagram (65507 bytes over IPv4) after the header. The
+    # nEmulator pads and truncates packets to 512 bytes, which leaves 496.
+    MAX_DATA_LENGTH = 65491
+    # Sequence numbers wrap at the width agreed in the handshake, at most the 32 bits
+    # of the header field.
+    SEQ_NUM_MODULO = 1 << 32
+    # The first header word holds the connection ID in its upper 16 bits and the
+    # packet type in its lower 16 bits, so packets without one are connection 0.
+    # nEmulator reads the whole word as the type and only spares EOT packets from
+    # being discarded if it is 2, so only connection 0 may go through it.
+    MAX_CONNECTION_ID = 0xFFFF
 
-    def __init__(self, type, seq_num, data):
+    def __init__(self, type, seq_num, data, connection_id=0):
         if len(data) > self.MAX_DATA_LENGTH:
-            raise Exception("Data too large (max 500 char): ", len(data))
+            raise Exception(f"Data too large (max {self.MAX_DATA_LENGTH} bytes): ",
+                            len(data))
 
         self.type = type
         self.seq_num = seq_num % self.SEQ_NUM_MODULO
         self.data = data
+        self.connection_id = connection_id
 
-    def get_udp_data(self):
+    def get_udp_data(self, checksum=True):
+        # Without a checksum the field is zero, which receivers do not verify.
         array = bytearray()
-        array.extend(self.type.to_bytes(length=4, byteorder="big"))
+        array.extend(self.connection_id.to_bytes(length=2, byteorder="big"))
+        array.extend(self.type.to_bytes(length=2, byteorder="big"))
         array.extend(self.seq_num.to_bytes(length=4, byteorder="big"))
         array.extend(len(self.data).to_bytes(length=4, byteorder="big"))
-        array.extend(self.data.encode())
+        # CRC32 of the header fields above and the data.
+        checksum = zlib.crc32(self.data, zlib.crc32(array)) if checksum else 0
+        array.extend(checksum.to_bytes(length=4, byteorder="big"))
+        array.extend(self.data)
         return array
 
+    def get_sack_blocks(self):
+        # An ACK's data holds (start, end) pairs of inclusive sequence numbers the
+        # receiver holds beyond seq_num.
+        return [(int.from_bytes(self.data[i:i + 4], byteorder="big"),
+                 int.from_bytes(self.data[i + 4:i + 8], byteorder="big"))
+                for i in range(0, len(self.data) - 7, 8)]
+
+    @staticmethod
+    def create_ack(seq_num, sack_blocks=(), connection_id=0):
+        data = bytearray()
+        for start, end in sack_blocks:
+            data.extend(start.to_bytes(length=4, byteorder="big"))
+            data.extend(end.to_bytes(length=4, byteorder="big"))
+        return packet(0, seq_num, bytes(data), connection_id)
+
+    @staticmethod
+    def create_packet(seq_num, data, connection_id=0):
+        return packet(1, seq_num, data, connection_id)
+
+    @staticmethod
+    def create_parity(seq_num, data, connection_id=0):
+        return packet(3, seq_num, data, connection_id)
+
     @staticmethod
-    def create_ack(seq_num):
-        return packet(0, seq_num, "")
+    def create_eot(seq_num, connection_id=0):
+        return packet(2, seq_num, b"", connection_id)
+
+    @staticmethod
+    def create_resume(offset=None, connection_id=0):
+        # A request from the sender carries no data, the receiver's reply carries the
+        # byte offset to continue the file from.
+        data = b"" if offset is None else offset.to_bytes(length=8, byteorder="big")
+        return packet(4, 0, data, connection_id)
+
+    def get_resume_offset(self):
+        return int.from_bytes(self.data, byteorder="big") if self.data else None
 
     @staticmethod
-    def create_packet(seq_num, data):
-        return packet(1, seq_num, data)
+    def create_syn(data, connection_id=0):
+        return packet(5, 0, data, connection_id)
 
     @staticmethod
-    def create_eot(seq_num):
-        return packet(2, seq_num, "")
+    def create_abort(connection_id=0):
+        return packet(6, 0, b"", connection_id)
 
     @staticmethod
     def parse_udp_data(UDPdata):
-        type = int.from_bytes(UDPdata[0:4], byteorder="big")
+        connection_id = int.from_bytes(UDPdata[0:2], byteorder="big")
+        type = int.from_bytes(UDPdata[2:4], byteorder="big")
         seq_num = int.from_bytes(UDPdata[4:8], byteorder="big")
         length = int.from_bytes(UDPdata[8:12], byteorder="big")
+        checksum = int.from_bytes(UDPdata[12:16], byteorder="big")
+        UDPdata = bytes(UDPdata[:16 + length])
+        # As in UDP, a zero checksum means the sender did not compute one.
+        if checksum and zlib.crc32(UDPdata[16:], zlib.crc32(UDPdata[0:12])) != checksum:
+            raise CorruptPacketException(
+                f"Checksum mismatch for packet type {type} with no: {seq_num}.")
         if type == 0:
-            return packet.create_ack(seq_num)
+            return packet(type, seq_num, UDPdata[16:], connection_id)
         elif type == 2:
-            return packet.create_eot(seq_num)
+            return packet.create_eot(seq_num, connection_id)
         else:
-            UDPdata = UDPdata[12:12 + length].decode()
-            return packet(type, seq_num, UDPdata)
\ No newline at end of file
+            return packet(type, seq_num, UDPdata[16:], connection_id)
\ No newline at end of file
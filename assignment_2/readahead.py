@@ -0,0 +1,191 @@
+import mmap
+import os
+from queue import Empty, Queue
+from threading import Thread
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import compression
+import constants
+from packet import packet
+
+# A data packet's payload, its encoding and the number of bytes of the file it
+# completes, only acknowledged with it.
+EncodedPacket = Tuple[bytes, bytes, int]
+
+
+class PacketReader(object):
+    """ Slices a file into payloads and encodes each as a data packet, numbered
+    consecutively from the window's next sequence number.
+
+    The file is read in large blocks. In the background, blocks are read and encoded
+    ahead of the sender into a bounded queue, so disk reads and encoding stay off the
+    send path and the window only has to send. Iterate to get (payload, encoded
+    packet, file bytes) tuples in order.
+
+    If compressing, every constants.COMPRESSION_BLOCK_SIZE bytes of the file are
+    compressed on their own and start a new packet, so the last packet of each may be
+    short. Its file bytes are credited to that last packet, the one that lets the
+    receiver decompress them. The headers of an archive.ArchiveReader are not file
+    bytes.
+    """
+
+    def __init__(self, file: BinaryIO, payload_size: int, seq_num: int, modulo: int,
+                 connection_id: int = 0, checksum: bool = True,
+                 background: bool = True, use_mmap: bool = False,
+                 compress: bool = False,
+                 block_size: int = constants.READ_AHEAD_BLOCK_SIZE,
+                 queue_size: int = constants.READ_AHEAD_QUEUE_SIZE):
+        """ Constructor.
+
+        Args:
+            file: The file to send, read from its current position.
+            payload_size: Number of bytes of the file in each packet.
+            seq_num: Sequence number of the first packet.
+            modulo: Number at which sequence numbers wrap.
+            connection_id: Connection ID to put in every packet's header.
+            checksum: If False, packets are encoded without a checksum.
+            background: If True, reads and encodes ahead on a thread. Otherwise blocks
+                are read as they are needed.
+            use_mmap: If True, memory-maps the file instead of reading it. Only
+                supported for regular files.
+            compress: If True, the file is compressed with
+                compression.compress_block before it is sliced into payloads.
+            block_size: Number of bytes to read at a time, rounded down to a whole
+                number of payloads, or of compression blocks if compressing.
+            queue_size: Number of encoded blocks that may wait for the sender.
+        """
+        self.file = file
+        self.payload_size = payload_size
+        self.seq_num = seq_num
+        self.modulo = modulo
+        self.connection_id = connection_id
+        self.checksum = checksum
+        self.background = background
+        self.use_mmap = use_mmap
+        self.compress = compress
+        unit = constants.COMPRESSION_BLOCK_SIZE if compress else payload_size
+        self.block_size = max(unit, block_size - block_size % unit)
+        self._queue = Queue(queue_size)
+        self._stopped = False
+        self._thread = None
+        if background:
+            self._thread = Thread(target=self._read_ahead, daemon=True)
+            self._thread.start()
+
+    def _read_blocks(self) -> Iterator[Tuple[bytes, int]]:
+        # (block, number of archive header bytes in it) tuples.
+        if not self.use_mmap:
+            headers = getattr(self.file, "header_bytes", 0)
+            block = self.file.read(self.block_size)
+            while block:
+                read = getattr(self.file, "header_bytes", 0)
+                yield block, read - headers
+                headers = read
+                block = self.file.read(self.block_size)
+            return
+
+        offset = self.file.tell()
+        size = os.fstat(self.file.fileno()).st_size
+        if offset >= size:
+            # Empty files cannot be mapped.
+            return
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+            # Views of the mapping must be released before it is closed.
+            view = memoryview(mapped)
+            try:
+                for start in range(offset, size, self.block_size):
+                    block = view[start:start + self.block_size]
+                    try:
+                        yield block, 0
+                    finally:
+                        block.release()
+            finally:
+                view.release()
+
+    def _encode(self, block: bytes, headers: int) -> List[EncodedPacket]:
+        if not self.compress:
+            packets = self._packetize(block)
+        else:
+            packets = []
+            for start in range(0, len(block), constants.COMPRESSION_BLOCK_SIZE):
+                chunk = block[start:start + constants.COMPRESSION_BLOCK_SIZE]
+                packets.extend(self._packetize(compression.compress_block(chunk),
+                                               len(chunk)))
+        if headers:
+            data, udp_data, file_bytes = packets[-1]
+            packets[-1] = (data, udp_data, file_bytes - headers)
+        return packets
+
+    def _packetize(self, block: bytes,
+                   file_bytes: Optional[int] = None) -> List[EncodedPacket]:
+        # file_bytes are credited to the last packet, if None each packet is credited
+        # its own payload.
+        packets = []
+        view = memoryview(block)
+        for start in range(0, len(view), self.payload_size):
+            data = bytes(view[start:start + self.payload_size])
+            packets.append((data, packet.create_packet(
+                self.seq_num, data, self.connection_id).get_udp_data(self.checksum),
+                len(data) if file_bytes is None else 0))
+            self.seq_num = (self.seq_num + 1) % self.modulo
+        view.release()
+        if file_bytes is not None and packets:
+            data, udp_data, _ = packets[-1]
+            packets[-1] = (data, udp_data, file_bytes)
+        return packets
+
+    def _read_ahead(self):
+        try:
+            for block, headers in self._read_blocks():
+                self._queue.put(self._encode(block, headers))
+                if self._stopped:
+                    return
+        except Exception as e:
+            # Raised to the sender when it reaches this point of the file.
+            self._queue.put(e)
+            return
+        self._queue.put(None)
+
+    def blocks(self) -> Iterator[List[EncodedPacket]]:
+        """ Returns the encoded packets a block at a time, in order. Getting the next
+        block may wait for the disk.
+        """
+        if not self.background:
+            for block, headers in self._read_blocks():
+                yield self._encode(block, headers)
+            return
+
+        while True:
+            packets = self._queue.get()
+            if packets is None:
+                return
+            if isinstance(packets, Exception):
+                raise packets
+            yield packets
+
+    def __iter__(self) -> Iterator[EncodedPacket]:
+        for packets in self.blocks():
+            yield from packets
+
+    def close(self):
+        """ Stops reading ahead, e.g. if the transfer is abandoned."""
+        if self._thread is None:
+            return
+        self._stopped = True
+        # Make room for the block the thread may be waiting to queue.
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Empty:
+            pass
+        self._thread.join()
+        self._thread = None
+        # Wake a thread still waiting in blocks().
+        self._queue.put_nowait(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
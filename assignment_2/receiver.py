@@ -1,17 +1,35 @@
 from argparse import ArgumentParser
-from socket import socket, AF_INET, SOCK_DGRAM
-import time
+import os
+import select
+from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF
+from typing import List, Optional, Tuple
 
+from ack_policy import AckPolicy
+from archive import ArchiveWriter
+from compression import BlockDecoder
 import constants
+from custom_exceptions import CompressionException, CorruptPacketException
+import fec
+import gso
+from handshake import ConnectionParameters
 from packet import packet
 import log
+from stats import ReceiverStats
+from writer import FileWriter, read_checkpoint
 
 logger = log.configure_receiver_logger("receiver", info_stdout=constants.PRINT_INFO)
 
 
 class Receiver(object):
 
-    def __init__(self, hostname: str, ack_port: int, data_port: int, filename: str):
+    def __init__(self, hostname: str, ack_port: int, data_port: int, filename: str,
+                 preallocate: int = 0, ack_every: int = constants.ACK_EVERY,
+                 ack_delay: float = constants.ACK_DELAY,
+                 sack: bool = constants.SACK_ENABLED,
+                 stats_file: str = constants.RECEIVER_STATS_LOG,
+                 ack_socket: Optional[socket] = None,
+                 write_buffer_size: int = constants.WRITE_BUFFER_SIZE,
+                 archive: bool = False, resume: bool = False, use_gro: bool = False):
         """
 
         Args:
@@ -19,12 +37,61 @@ class Receiver(object):
             ack_port: The port to send ack messages to on the emulator.
             data_port: The port the emulator will send data packets to the receiver via.
             filename: The name of the file to save data into.
+            preallocate: If non-zero, the expected file size in bytes to reserve on
+                disk before receiving.
+            ack_every: Number of in-order packets to coalesce into one ACK.
+            ack_delay: Maximum number of seconds to delay an in-order ACK.
+            sack: If True, buffers packets that arrive out of order and reports them
+                to the sender with SACK blocks.
+            stats_file: The file to write the transfer's statistics to as JSON.
+            ack_socket: Socket to send ACKs from. A new one is created if None.
+            write_buffer_size: Number of received bytes to hold in memory before
+                writing them to the file.
+            archive: If True, filename is a directory and the transfer is an archive
+                of files to save into it.
+            resume: If True, keeps a checkpoint of the bytes committed to disk and lets
+                a sender that asks to resume continue the file from it. Not supported
+                for archives.
+            use_gro: If True, datagrams are received several at a time using Linux
+                UDP GRO, if the kernel supports it.
         """
         self.hostname = hostname
         self.ack_port = ack_port
         self.data_port = data_port
         self.filename = filename
-        self.seq_num = 0
+        self.preallocate = preallocate
+        self.use_gro = use_gro
+        self.write_buffer_size = write_buffer_size
+        self.archive = archive
+        self.resume = resume and not archive
+        # Byte offset of the file the transfer started from.
+        self.resume_offset = 0
+        self.writer = None
+        self.acks = AckPolicy(ack_every, ack_delay)
+        self.ack_socket = ack_socket if ack_socket is not None else \
+            socket(AF_INET, SOCK_DGRAM)
+        # Connection ID of the transfer, echoed in ACKs and EOT.
+        self.connection_id = 0
+        self.sack = sack
+        # Settings agreed with the sender, None until its SYN or first packet.
+        self.parameters = None
+        self.modulo = constants.MODULO_RANGE
+        self.window_size = constants.WINDOW_SIZE
+        # Largest datagram that may arrive, header included.
+        self.receive_size = constants.PACKET_DATA_SIZE
+        # Sequence number of the last in-order packet received.
+        self.seq_num = self.modulo - 1
+        # Map of sequence number -> data for packets received ahead of seq_num.
+        self.out_of_order = {}
+        # Map of sequence number -> data of the most recently delivered packets, used
+        # to rebuild lost packets from parity.
+        self.delivered = {}
+        self.stats_file = stats_file
+        self.stats = ReceiverStats()
+        # Decompresses the data if the sender compresses it, None otherwise.
+        self.decoder = None
+        # Why the transfer was abandoned, None while it is going well.
+        self.error = None
 
     def send_ack(self, seq_num: int):
         """ Sends an ACK packet for a sequence number.
@@ -32,32 +99,130 @@ class Receiver(object):
         Args:
             seq_num: Sequence number of the packet to mention in the ACK.
         """
-        socket(AF_INET, SOCK_DGRAM).sendto(packet.create_ack(seq_num).get_udp_data(),
-                                           (self.hostname, self.ack_port))
+        self.ack_socket.sendto(
+            packet.create_ack(seq_num, self.get_sack_blocks(),
+                              self.connection_id).get_udp_data(),
+            (self.hostname, self.ack_port))
+        self.acks.sent()
+        self.stats.acks_sent += 1
+
+    def get_sack_blocks(self) -> List[Tuple[int, int]]:
+        """ Returns the ranges of packets held out of order.
+
+        Returns:
+            Up to constants.MAX_SACK_BLOCKS (start, end) inclusive sequence number
+            ranges, nearest to seq_num first.
+        """
+        blocks = []
+        # Walk only the packets held, in order of their distance from seq_num.
+        for offset in sorted((num - self.seq_num) % self.modulo
+                             for num in self.out_of_order):
+            if offset > self.window_size:
+                break
+            num = (self.seq_num + offset) % self.modulo
+            if blocks and blocks[-1][1] == (num - 1) % self.modulo:
+                blocks[-1] = (blocks[-1][0], num)
+            elif len(blocks) < constants.MAX_SACK_BLOCKS:
+                blocks.append((num, num))
+            else:
+                break
+        return blocks
 
     def send_EOT(self, seq_num):
         """ Sends an EOT packet.
         """
-        socket(AF_INET, SOCK_DGRAM).sendto(packet.create_eot(seq_num).get_udp_data(),
-                                           (self.hostname, self.ack_port))
+        self.ack_socket.sendto(
+            packet.create_eot(seq_num, self.connection_id).get_udp_data(),
+            (self.hostname, self.ack_port))
+
+    def send_abort(self):
+        """ Sends an ABORT packet, telling the sender the transfer was abandoned.
+        """
+        self.ack_socket.sendto(
+            packet.create_abort(self.connection_id).get_udp_data(),
+            (self.hostname, self.ack_port))
 
-    def handle_message(self, socket) -> packet:
-        """ Handles the receiving of packets, sending acks and storing data locally.
+    def receive_messages(self, data_socket,
+                         timeout: Optional[float] = None) -> List[bytes]:
+        """ Blocks until data arrives, then drains every pending datagram without
+        blocking.
 
         Args:
-            socket: The socket to receive data from.
+            data_socket: A non-blocking socket to receive data from.
+            timeout: Maximum number of seconds to block for, None to block until data
+                arrives.
 
         Returns:
-            The parsed packet object of the most recent message.
+            Up to constants.RECEIVE_BATCH_SIZE raw messages, in arrival order. Empty if
+            the timeout expired.
+        """
+        select.select([data_socket], [], [], timeout)
+        messages = []
+        while len(messages) < constants.RECEIVE_BATCH_SIZE:
+            try:
+                if self.use_gro:
+                    segments, _ = gso.receive_segments(data_socket)
+                    messages.extend(segments)
+                    continue
+                message, _ = data_socket.recvfrom(self.receive_size)
+            except BlockingIOError:
+                break
+            messages.append(message)
+        return messages
+
+    def handle_message(self, message: bytes) -> packet:
+        """ Handles a received packet, sending acks and storing data locally.
+
+        Args:
+            message: The raw message received from the emulator.
+
+        Returns:
+            The parsed packet object of the message, None if it could not be parsed.
         """
-        message, _ = socket.recvfrom(constants.PACKET_DATA_SIZE)
         try:
             p = packet.parse_udp_data(message)
+        except CorruptPacketException as e:
+            self.stats.corrupt += 1
+            logger.log(f"Dropped corrupt packet: {e}")
+            return None
         except Exception as e:
             logger.log(f"ERROR: {e}")
             return None
+        return self.handle_packet(p)
+
+    def handle_packet(self, p: packet) -> packet:
+        """ Handles a parsed packet, sending acks and storing data locally.
+
+        Args:
+            p: The packet received from the emulator.
+
+        Returns:
+            The packet.
+        """
         logger.log(f"Received packet with no: {p.seq_num}."
-                   f"Looking for {(self.seq_num + 1) % constants.MODULO_RANGE}")
+                   f"Looking for {(self.seq_num + 1) % self.modulo}")
+        if self.error is not None:
+            # Answered again in case the first ABORT was lost.
+            self.send_abort()
+            return p
+        self.connection_id = p.connection_id
+
+        if p.type == constants.TYPE_SYN:
+            self.handle_syn(p)
+            return p
+
+        if self.parameters is None:
+            # The sender started without a handshake, use the settings from before it.
+            self.configure(ConnectionParameters(
+                flags=self.get_supported_parameters().flags))
+
+        if p.type == constants.TYPE_RESUME:
+            self.handle_resume()
+            return p
+
+        if self.writer is None:
+            # The sender started without asking to resume.
+            self.open_writer(0)
 
         if p.type == constants.TYPE_EOT:
             logger.log("Received EOT.")
@@ -68,40 +233,318 @@ class Receiver(object):
             logger.log("[ERROR] Received ACK.")
             return p
 
+        elif p.type == constants.TYPE_PARITY:
+            self.handle_parity(p)
+            return p
+
         # Else data message
         logger.arrival(p.seq_num)
-        if p.seq_num == (self.seq_num + 1) % constants.MODULO_RANGE:
+        self.stats.start()
+        self.stats.packets_received += 1
+        self.handle_data(p.seq_num, p.data)
+        return p
+
+    def deliver(self, seq_num: int, data: bytes):
+        """ Writes the next in-order packet to the file.
+
+        Args:
+            seq_num: Sequence number of the packet, one after self.seq_num.
+            data: The payload of the packet.
+        """
+        if self.decoder is not None:
+            try:
+                blocks = self.decoder.feed(data)
+            except CompressionException as e:
+                self.abort(f"Could not decompress packet {seq_num}: {e}")
+                return
+            for block in blocks:
+                self.writer.write(block)
+                self.stats.bytes_delivered += len(block)
+        else:
+            self.writer.write(data)
+            self.stats.bytes_delivered += len(data)
+        self.seq_num = seq_num
+        self.delivered[seq_num] = data
+        # Parity groups fit in a window, older packets are never needed again.
+        self.delivered.pop((seq_num - self.window_size) % self.modulo, None)
+
+    def handle_data(self, seq_num: int, data: bytes):
+        """ Stores a data packet, or buffers it if it arrived out of order, and ACKs it.
+
+        Args:
+            seq_num: Sequence number of the packet.
+            data: The payload of the packet.
+        """
+        if seq_num == (self.seq_num + 1) % self.modulo:
             # Expected, next packet
-            with open(self.filename, "a") as f:
-                f.write(p.data)
-            self.send_ack(self.seq_num)
-            logger.log(f"Sending ACK for good packet with no: {self.seq_num + 1}")
-            self.seq_num = p.seq_num
+            self.deliver(seq_num, data)
+
+            # Deliver any packets it was the gap for.
+            filled_gap = False
+            next_num = (self.seq_num + 1) % self.modulo
+            while next_num in self.out_of_order:
+                self.deliver(next_num, self.out_of_order.pop(next_num))
+                next_num = (self.seq_num + 1) % self.modulo
+                filled_gap = True
+
+            if self.acks.on_in_order() or filled_gap:
+                self.send_ack(self.seq_num)
+                logger.log(f"Sending ACK for good packet with no: {self.seq_num}")
         else:
-            self.send_ack(self.seq_num)
-            logger.log(f"Sending ACK for bad packet with no: {self.seq_num}")
-        return p
+            distance = (seq_num - self.seq_num) % self.modulo
+            if 1 < distance <= self.window_size and seq_num not in self.out_of_order:
+                self.stats.out_of_order += 1
+                if self.parameters.has(constants.FLAG_SACK):
+                    self.out_of_order[seq_num] = data
+            else:
+                # Already delivered or already buffered.
+                self.stats.duplicates += 1
+            if self.acks.on_out_of_order():
+                self.send_ack(self.seq_num)
+                logger.log(f"Sending ACK for bad packet with no: {self.seq_num}")
+
+    def get_supported_parameters(self) -> ConnectionParameters:
+        """ Returns the most the receiver supports, offered in answer to a SYN.
+        """
+        flags = constants.FLAG_CHECKSUM | constants.FLAG_COMPRESSION | \
+            (constants.FLAG_SACK if self.sack else 0) | \
+            (constants.FLAG_ARCHIVE if self.archive else 0)
+        return ConnectionParameters(constants.MAX_WINDOW_SIZE, packet.MAX_DATA_LENGTH,
+                                    constants.MAX_SEQUENCE_BITS, flags)
+
+    def configure(self, parameters: ConnectionParameters):
+        """ Applies the settings agreed with the sender.
+
+        Args:
+            parameters: The settings the transfer uses.
+        """
+        self.parameters = parameters
+        self.modulo = parameters.modulo
+        self.window_size = parameters.window_size
+        self.receive_size = max(constants.PACKET_DATA_SIZE,
+                                constants.HEADER_SIZE + parameters.mss)
+        self.seq_num = self.modulo - 1
+        self.decoder = BlockDecoder() \
+            if parameters.has(constants.FLAG_COMPRESSION) else None
+        self.stats.parameters = parameters.to_dict()
+
+    def handle_syn(self, syn: packet):
+        """ Confirms the settings proposed by a sender. The first SYN decides them,
+        repeated ones get the same answer.
+
+        Args:
+            syn: The SYN packet received from the sender.
+        """
+        proposal = ConnectionParameters.parse_syn(syn)
+        if self.parameters is None:
+            self.configure(self.get_supported_parameters().negotiate(proposal))
+        logger.log(f"Confirmed settings: {self.parameters.to_dict()}")
+        self.ack_socket.sendto(
+            self.parameters.create_syn(self.connection_id).get_udp_data(),
+            (self.hostname, self.ack_port))
+        # The sender refuses the transfer too, once it sees the receiver's mode.
+        if proposal.has(constants.FLAG_ARCHIVE) and not self.archive:
+            self.abort("The sender is sending an archive, run with --archive to "
+                       "receive it.")
+        elif self.archive and not proposal.has(constants.FLAG_ARCHIVE):
+            self.abort("The sender is not sending an archive.")
+
+    def handle_resume(self):
+        """ Answers a sender asking where to continue the file from. The first request
+        decides the offset, repeated requests get the same answer.
+        """
+        if self.writer is None:
+            offset = 0
+            if self.resume:
+                offset = read_checkpoint(self.get_checkpoint()) or 0
+            self.open_writer(offset)
+        logger.log(f"Resuming from byte: {self.resume_offset}")
+        self.ack_socket.sendto(
+            packet.create_resume(self.resume_offset, self.connection_id).get_udp_data(),
+            (self.hostname, self.ack_port))
+
+    def handle_parity(self, parity: packet):
+        """ Rebuilds a lost packet from a parity packet if it is the only packet of its
+        group still missing.
+
+        Args:
+            parity: A parity packet sent by the window in FEC mode.
+        """
+        members = []
+        missing = []
+        for num in fec.get_group(parity, self.modulo):
+            distance = (num - self.seq_num) % self.modulo
+            if not 0 < distance <= self.window_size:
+                if num not in self.delivered:
+                    # Too old to rebuild from, the group is larger than the window.
+                    return
+                members.append(self.delivered[num])
+            elif num in self.out_of_order:
+                members.append(self.out_of_order[num])
+            else:
+                missing.append(num)
+
+        if len(missing) != 1:
+            return
+
+        logger.log(f"Recovered packet with no: {missing[0]} from parity.")
+        self.stats.recovered += 1
+        self.handle_data(missing[0], fec.recover(parity, members))
+
+    def open(self):
+        """ Resets the receiver's state and opens the file for a new transfer.
+        """
+        self.parameters = None
+        self.modulo = constants.MODULO_RANGE
+        self.window_size = constants.WINDOW_SIZE
+        self.receive_size = constants.PACKET_DATA_SIZE
+        self.seq_num = self.modulo - 1
+        self.out_of_order = {}
+        self.delivered = {}
+        self.stats = ReceiverStats()
+        self.error = None
+        # Opened by the first packet, once it is known where the transfer starts.
+        self.writer = None
+
+    def get_checkpoint(self) -> str:
+        """ Returns the name of the file recording how much of the file is on disk.
+        """
+        return self.filename + constants.CHECKPOINT_SUFFIX
+
+    def open_writer(self, offset: int):
+        """ Opens the file to save data into.
+
+        Args:
+            offset: Byte offset to continue the file from.
+        """
+        self.resume_offset = offset
+        self.stats.resume_offset = offset
+        if self.archive:
+            self.writer = ArchiveWriter(self.filename, self.write_buffer_size)
+        elif self.resume:
+            self.writer = FileWriter(self.filename, self.write_buffer_size,
+                                     preallocate=self.preallocate, resume_offset=offset,
+                                     checkpoint=self.get_checkpoint())
+        else:
+            self.writer = FileWriter(self.filename, self.write_buffer_size,
+                                     preallocate=self.preallocate)
+
+    def abort(self, error: str):
+        """ Abandons the transfer after an error it cannot recover from. The data
+        received before it is kept, and the sender is sent an ABORT instead of ever
+        having its EOT answered.
+
+        Args:
+            error: What went wrong.
+        """
+        logger.log(f"[ERROR] Aborting transfer: {error}")
+        self.error = error
+        if self.writer is not None:
+            self.writer.close()
+        self.stats.error = error
+        self.stats.finish()
+        self.stats.save(self.stats_file)
+        self.send_abort()
+
+    def close(self, eot: packet):
+        """ Commits the received file to disk, answers the sender's EOT and writes the
+        transfer's statistics.
+
+        Args:
+            eot: The EOT packet received from the sender.
+        """
+        if self.decoder is not None and self.decoder.pending():
+            logger.log(f"[ERROR] Transfer ended inside a compressed block, "
+                       f"{self.decoder.pending()} bytes were not decompressed.")
+        # All data has arrived, commit it to disk.
+        self.writer.close()
+        self.stats.finish()
+        if self.resume:
+            # The transfer is complete, there is nothing left to resume.
+            os.remove(self.get_checkpoint())
+
+        # Send EOT back
+        self.send_EOT(eot.seq_num)
+        self.stats.save(self.stats_file)
 
     def run(self):
         """ Main thread for running a receiver.
         """
-        self.seq_num = 0
-        self.data = ""
+        self.open()
 
         # Setup UDP port for receiving data
         data_socket = socket(AF_INET, SOCK_DGRAM)
+        # Room for a full window of the largest packets.
+        data_socket.setsockopt(SOL_SOCKET, SO_RCVBUF, constants.SOCKET_BUFFER_SIZE)
         data_socket.bind((self.hostname, self.data_port))
+        data_socket.setblocking(False)
+        if self.use_gro and not gso.enable_gro(data_socket):
+            logger.log("UDP GRO is not supported, receiving packets one at a time.")
+            self.use_gro = False
 
-        # do-while handling packets until it receives EOT
-        packet = self.handle_message(data_socket)
-        while packet.type != constants.TYPE_EOT:
-            new_packet = self.handle_message(data_socket)
-            if new_packet:
-                packet = new_packet
-            time.sleep(constants.PROCESS_WAIT)
+        # Handle packets in batches until it receives EOT
+        eot = None
+        while eot is None and self.error is None:
+            messages = self.receive_messages(data_socket, self.acks.time_until_due())
+            for message in messages:
+                p = self.handle_message(message)
+                if p and p.type == constants.TYPE_EOT:
+                    eot = p
+                    break
+                if self.error is not None:
+                    break
 
-        # Send EOT back
-        self.send_EOT(packet.seq_num)
+            # Send any coalesced ACK whose delay has expired.
+            if self.acks.is_due():
+                self.send_ack(self.seq_num)
+                logger.log(f"Sending delayed ACK with no: {self.seq_num}")
+
+        if eot is not None:
+            self.close(eot)
+
+        while self.error is not None:
+            # Answer the sender until it stops, in case the ABORT was lost.
+            messages = self.receive_messages(data_socket, constants.ABORT_LINGER)
+            if not messages:
+                break
+            for message in messages:
+                self.handle_message(message)
+
+
+def add_receiver_arguments(parser: ArgumentParser, server: bool = False):
+    """ Adds the file and the settings every receiver takes to its command line.
+
+    Args:
+        parser: The receiver's parser, after the arguments that come before the file.
+        server: If True, only adds the settings receiver_server.py applies to every
+            transfer, which it saves into files of its own.
+    """
+    if not server:
+        parser.add_argument("filename", type=str,
+                            help="The name of the file to save data into.")
+        parser.add_argument("--preallocate", type=int, default=0,
+                            help="Expected size of the file in bytes to reserve on "
+                                 "disk.")
+    parser.add_argument("--ack-every", type=int, default=constants.ACK_EVERY,
+                        help="Number of in-order packets to coalesce into one ACK.")
+    parser.add_argument("--ack-delay", type=float, default=constants.ACK_DELAY,
+                        help="Maximum number of seconds to delay an in-order ACK.")
+    parser.add_argument("--no-sack", dest="sack", action="store_false",
+                        help="Discard out-of-order packets instead of reporting them "
+                             "with SACK blocks.")
+    if server:
+        parser.add_argument("--archive", action="store_true",
+                            help="Receive every transfer as an archive of files into "
+                                 "its own directory.")
+        return
+    parser.add_argument("--stats", default=constants.RECEIVER_STATS_LOG,
+                        help="File to write the transfer's statistics to as JSON.")
+    parser.add_argument("--archive", action="store_true",
+                        help="Receive several files or a directory into the directory "
+                             "filename.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Checkpoint the bytes committed to disk and let a sender "
+                             "with --resume continue an interrupted transfer.")
 
 
 def main():
@@ -113,12 +556,17 @@ def main():
                         help="The port to send ack messages to on the emulator.")
     parser.add_argument("data_port", type=int,
                         help="The port the emulator will send data packets to the receiver via.")
-    parser.add_argument("filename", type=str,
-                        help="The name of the file to save data into.")
+    add_receiver_arguments(parser)
+    parser.add_argument("--gro", action="store_true",
+                        help="Receive several packets per syscall using UDP GRO (Linux "
+                             "only, falls back to one packet at a time).")
     args = parser.parse_args()
 
     # Run Receiver
-    receiver = Receiver(args.hostname, args.ack_port, args.data_port, args.filename)
+    receiver = Receiver(args.hostname, args.ack_port, args.data_port, args.filename,
+                        args.preallocate, args.ack_every, args.ack_delay, args.sack,
+                        args.stats, archive=args.archive, resume=args.resume,
+                        use_gro=args.gro)
     receiver.run()
 
 
@@ -0,0 +1,310 @@
+from argparse import ArgumentParser
+from collections import OrderedDict
+import os
+import select
+from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF
+import time
+from typing import List, Optional, Tuple
+
+import constants
+from custom_exceptions import CorruptPacketException
+import gso
+from packet import packet
+from receiver import Receiver, add_receiver_arguments, logger
+from timers import TimerWheel
+
+# A connection is identified by the sender's address and its connection ID.
+ConnectionKey = Tuple[Tuple[str, int], int]
+
+
+class ReceiverServer(object):
+    """ Long-running receiver accepting concurrent transfers on a single data port.
+
+    Packets are demultiplexed by the sender's address and the connection ID in their
+    header. Every connection gets its own Receiver, with its own reorder buffer, ACK
+    policy and output file, and ACKs go back to the address its packets come from.
+    A connection is closed when its EOT arrives and dropped if it goes idle.
+    """
+
+    def __init__(self, hostname: str, data_port: int, directory: str,
+                 idle_timeout: float = constants.SERVER_IDLE_TIMEOUT,
+                 linger: float = constants.SERVER_LINGER,
+                 ack_every: int = constants.ACK_EVERY,
+                 ack_delay: float = constants.ACK_DELAY,
+                 sack: bool = constants.SACK_ENABLED, archive: bool = False,
+                 use_gro: bool = False):
+        """ Constructor.
+
+        Args:
+            hostname: The hostname to receive data on.
+            data_port: The port to receive data from every sender on.
+            directory: The directory to save received files into.
+            idle_timeout: Seconds without a packet after which a connection is dropped
+                and its partial file closed.
+            linger: Seconds a finished connection's EOT is still answered for, in
+                case the sender did not receive the first one.
+            ack_every: Number of in-order packets to coalesce into one ACK.
+            ack_delay: Maximum number of seconds to delay an in-order ACK.
+            sack: If True, buffers packets that arrive out of order and reports them
+                to the sender with SACK blocks.
+            archive: If True, every transfer is an archive of files, saved into its own
+                directory.
+            use_gro: If True, datagrams are received several at a time using Linux
+                UDP GRO, if the kernel supports it.
+        """
+        self.hostname = hostname
+        self.data_port = data_port
+        self.directory = directory
+        self.idle_timeout = idle_timeout
+        self.linger = linger
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.sack = sack
+        self.archive = archive
+        self.use_gro = use_gro
+        self.socket = None
+        # Open connections, least recently active first, and when each last was.
+        self.connections = OrderedDict()
+        self.last_active = {}
+        # Finished connections, oldest first, and when each stops being answered.
+        self.finished = OrderedDict()
+        # Deadlines of the connections holding back a delayed ACK.
+        self.ack_timers = TimerWheel()
+
+    def get_filename(self, key: ConnectionKey) -> str:
+        """ Returns the name of the file a connection's data is saved into.
+
+        Args:
+            key: The connection's sender address and connection ID.
+        """
+        (host, port), connection_id = key
+        return os.path.join(self.directory, f"{host}_{port}_{connection_id}")
+
+    def open_connection(self, key: ConnectionKey) -> Receiver:
+        """ Starts receiving a new transfer.
+
+        Args:
+            key: The connection's sender address and connection ID.
+
+        Returns:
+            The connection's receiver.
+        """
+        (host, port), connection_id = key
+        filename = self.get_filename(key)
+        connection = Receiver(host, port, self.data_port, filename,
+                              ack_every=self.ack_every, ack_delay=self.ack_delay,
+                              sack=self.sack, stats_file=f"{filename}.stats.json",
+                              ack_socket=self.socket,
+                              write_buffer_size=constants.SERVER_WRITE_BUFFER_SIZE,
+                              archive=self.archive)
+        connection.connection_id = connection_id
+        connection.open()
+        self.connections[key] = connection
+        logger.log(f"Opened connection {connection_id} from {host}:{port}.")
+        return connection
+
+    def close_connection(self, key: ConnectionKey, eot: Optional[packet]):
+        """ Closes a connection, answering its EOT if it finished.
+
+        Args:
+            key: The connection's sender address and connection ID.
+            eot: The EOT packet the sender finished with, None if it went idle.
+        """
+        connection = self.connections.pop(key)
+        del self.last_active[key]
+        self.ack_timers.cancel(key)
+        if eot is None:
+            # A sender that only got as far as its SYN has no file open.
+            if connection.writer is not None:
+                connection.writer.close()
+            logger.log(f"Dropped idle connection {key[1]} from {key[0]}.")
+            return
+        connection.close(eot)
+        self.finished[key] = (time.monotonic() + self.linger, eot.seq_num)
+        logger.log(f"Closed connection {key[1]} from {key[0]}.")
+
+    def abort_connection(self, key: ConnectionKey):
+        """ Forgets a connection its receiver abandoned, answering its sender's
+        packets with ABORT while it lingers.
+
+        Args:
+            key: The connection's sender address and connection ID.
+        """
+        del self.connections[key]
+        del self.last_active[key]
+        self.ack_timers.cancel(key)
+        self.finished[key] = (time.monotonic() + self.linger, None)
+        logger.log(f"Aborted connection {key[1]} from {key[0]}.")
+
+    def handle_message(self, message: bytes, addr: Tuple[str, int]):
+        """ Hands a received packet to its connection, opening one if it is new.
+
+        Args:
+            message: The raw message received.
+            addr: The address it was received from.
+        """
+        try:
+            p = packet.parse_udp_data(message)
+        except CorruptPacketException as e:
+            # The connection ID cannot be trusted either.
+            logger.log(f"Dropped corrupt packet: {e}")
+            return
+        except Exception as e:
+            logger.log(f"ERROR: {e}")
+            return
+
+        key = (addr, p.connection_id)
+        if key in self.finished:
+            if self.finished[key][1] is None:
+                # Answered again in case the first ABORT was lost.
+                self.socket.sendto(
+                    packet.create_abort(p.connection_id).get_udp_data(), addr)
+            elif p.type == constants.TYPE_EOT:
+                self.socket.sendto(
+                    packet.create_eot(p.seq_num, p.connection_id).get_udp_data(), addr)
+            return
+
+        connection = self.connections.get(key)
+        if connection is None:
+            connection = self.open_connection(key)
+        self.connections.move_to_end(key)
+        self.last_active[key] = time.monotonic()
+
+        connection.handle_packet(p)
+        if connection.error is not None:
+            self.abort_connection(key)
+        elif p.type == constants.TYPE_EOT:
+            self.close_connection(key, p)
+        elif key not in self.ack_timers:
+            delay = connection.acks.time_until_due()
+            if delay is not None:
+                self.ack_timers.arm(key, delay)
+
+    def send_due_acks(self):
+        """ Sends every coalesced ACK whose delay has expired. Only connections whose
+        deadline has passed are visited.
+        """
+        for key in self.ack_timers.expire():
+            connection = self.connections[key]
+            if connection.acks.is_due():
+                connection.send_ack(connection.seq_num)
+                logger.log(f"Sending delayed ACK with no: {connection.seq_num}")
+            # An ACK sent since may have started a new delay.
+            delay = connection.acks.time_until_due()
+            if delay is not None:
+                self.ack_timers.arm(key, delay)
+
+    def expire(self):
+        """ Drops idle connections and forgets finished ones once they have lingered.
+        Both are ordered by time, so only expired entries are visited.
+        """
+        now = time.monotonic()
+        while self.connections:
+            key = next(iter(self.connections))
+            if self.last_active[key] + self.idle_timeout > now:
+                break
+            self.close_connection(key, None)
+
+        while self.finished:
+            key, (expiry, _) = next(iter(self.finished.items()))
+            if expiry > now:
+                break
+            del self.finished[key]
+
+    def time_until_next_event(self) -> Optional[float]:
+        """ Returns the number of seconds until a delayed ACK is due or a connection
+        expires, None if there is nothing to wait for.
+        """
+        deadlines = [self.ack_timers.time_until_next()]
+        now = time.monotonic()
+        if self.connections:
+            key = next(iter(self.connections))
+            deadlines.append(self.last_active[key] + self.idle_timeout - now)
+        if self.finished:
+            expiry, _ = next(iter(self.finished.values()))
+            deadlines.append(expiry - now)
+        deadlines = [d for d in deadlines if d is not None]
+        return max(0.0, min(deadlines)) if deadlines else None
+
+    def receive_messages(self, timeout: Optional[float]) -> List[Tuple[bytes, Tuple]]:
+        """ Blocks until data arrives, then drains every pending datagram without
+        blocking.
+
+        Args:
+            timeout: Maximum number of seconds to block for, None to block until data
+                arrives.
+
+        Returns:
+            Up to constants.RECEIVE_BATCH_SIZE (message, address) pairs, in arrival
+            order.
+        """
+        select.select([self.socket], [], [], timeout)
+        messages = []
+        while len(messages) < constants.RECEIVE_BATCH_SIZE:
+            try:
+                if self.use_gro:
+                    segments, addr = gso.receive_segments(self.socket)
+                    messages.extend((segment, addr) for segment in segments)
+                    continue
+                # Each sender may have agreed on a different payload size.
+                messages.append(self.socket.recvfrom(constants.MAX_DATAGRAM_SIZE))
+            except BlockingIOError:
+                break
+        return messages
+
+    def run(self):
+        """ Receives transfers until interrupted.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.socket = socket(AF_INET, SOCK_DGRAM)
+        self.socket.setsockopt(SOL_SOCKET, SO_RCVBUF, constants.SOCKET_BUFFER_SIZE)
+        self.socket.bind((self.hostname, self.data_port))
+        self.socket.setblocking(False)
+        if self.use_gro and not gso.enable_gro(self.socket):
+            logger.log("UDP GRO is not supported, receiving packets one at a time.")
+            self.use_gro = False
+
+        try:
+            while True:
+                for message, addr in self.receive_messages(self.time_until_next_event()):
+                    self.handle_message(message, addr)
+                self.send_due_acks()
+                self.expire()
+        finally:
+            for key in list(self.connections):
+                self.close_connection(key, None)
+            self.socket.close()
+
+
+def main():
+    # Parse arguments
+    parser = ArgumentParser(description='Receiver Server')
+    parser.add_argument("hostname", type=str,
+                        help="The hostname to receive data on.")
+    parser.add_argument("data_port", type=int,
+                        help="The port to receive data from every sender on.")
+    parser.add_argument("directory", type=str,
+                        help="The directory to save received files into.")
+    parser.add_argument("--idle-timeout", type=float,
+                        default=constants.SERVER_IDLE_TIMEOUT,
+                        help="Seconds without a packet after which a transfer is dropped.")
+    parser.add_argument("--linger", type=float, default=constants.SERVER_LINGER,
+                        help="Seconds a finished transfer's EOT is still answered for.")
+    add_receiver_arguments(parser, server=True)
+    parser.add_argument("--gro", action="store_true",
+                        help="Receive several packets per syscall using UDP GRO (Linux "
+                             "only, falls back to one packet at a time).")
+    args = parser.parse_args()
+
+    # Run Server
+    server = ReceiverServer(args.hostname, args.data_port, args.directory,
+                            args.idle_timeout, args.linger, args.ack_every,
+                            args.ack_delay, args.sack, args.archive, args.gro)
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
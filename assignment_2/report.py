@@ -1,6 +1,34 @@
-import subprocess
-import os
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import filecmp
+import itertools
+import json
+import os
+import queue
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import constants
+
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+HOST = "127.0.0.1"
+
+
+def percentile(values: List[float], p: float) -> float:
+    """ Returns the p-th percentile of values using the nearest-rank method.
+
+    Args:
+        values: A non-empty list of samples.
+        p: The percentile, between 0 and 100.
+    """
+    ordered = sorted(values)
+    rank = max(1, int(-(-p * len(ordered) // 100)))
+    return ordered[rank - 1]
 
 
 class ReportTesting(object):
@@ -11,72 +39,208 @@ class ReportTesting(object):
         (20, 0.1), (20, 0.2), (20, 0.3), (40, 0.1), (40, 0.2), (40, 0.3)
     ]
 
-    FILE_SIZES = ["small.txt"] # mall.txt", "medium.txt"] # , "large.txt"]
+    FILE_SIZES = ["small.txt", "medium.txt", "large.txt"]
+
+    # Protocol mode -> (extra sender arguments, extra receiver arguments)
+    PROTOCOL_MODES = {
+        "gbn": ([], ["--no-sack", "--ack-every", "1"]),
+        "sack": ([], []),
+        "fec": (["--fec", "4"], []),
+        "paced": (["--pace-rtt"], []),
+    }
+
     ATTEMPT_COUNT = 3
-    TIME_LOG = "testing.time.log"
-    def __init__(self):
+
+    def __init__(self, jobs: int = 1, base_port: int = constants.REPORT_BASE_PORT,
+                 run_timeout: float = constants.REPORT_RUN_TIMEOUT):
+        """ Constructor.
+
+        Args:
+            jobs: Number of transfers to run in parallel.
+            base_port: First port of the range given to parallel transfers. Each job
+                uses its own block of four ports.
+            run_timeout: Seconds after which a transfer is abandoned.
+        """
+        self.jobs = jobs
+        self.run_timeout = run_timeout
+        self.ports = queue.Queue()
+        for job in range(jobs):
+            self.ports.put(base_port + 4 * job)
+        # Map from (delay, discard_prob, filename, mode) -> list of times in ms.
         self.results = {}
+        self.failures = {}
 
-    def run(self, delay, discard_prob):
-        """ Runs all combinations from the TESTING_CONFIG and FILE_SIZES.
+    def run_once(self, delay: int, discard_prob: float, filename: str, mode: str,
+                 seed: int) -> Optional[float]:
+        """ Runs a single transfer through emulator.py in a scratch directory.
+
+        Args:
+            delay: Maximum delay of the emulated link in milliseconds.
+            discard_prob: Probability the emulator discards a packet.
+            filename: The file to transfer.
+            mode: A key of PROTOCOL_MODES.
+            seed: Seed for the emulator.
 
         Returns:
+            The transmission time in milliseconds logged by the sender, or None if the
+            transfer did not complete or the received file differs.
         """
-        for config in ReportTesting.TESTING_CONFIG:
-            # delay, discard_prob = config
-            print(str(delay), str(discard_prob))
-            # Setup network
-            # network = subprocess.Popen(["nohup", "sh",  "network.sh", str(delay), str(discard_prob)])
-            print('Network Configured.')
-
-            file_averages = []
-            # Test all files three times
-            for f in ReportTesting.FILE_SIZES:
-                for attempt in range(ReportTesting.ATTEMPT_COUNT):
-                    print(f"Running attempt: {attempt} for file {f}. Config: {config}")
-                    test = subprocess.Popen(["nohup", "sh",  "testing.sh", f])
-                    # sender = subprocess.Popen(["nohup", "sh",  "sender.sh", f])
-                    # receiver = subprocess.Popen(["nohup", "sh", "receiver.sh", f])
-                    print("Waiting...")
-                    test.wait()
-                    print("Sender Done")
-                    # receiver.wait()
-                    print("Done.\n")
-                print(f"Run testing for {f}")
-                with open(ReportTesting.TIME_LOG, "r") as f:
-                    data = f.readlines()
-                average = sum([float(d[:-1]) for d in data]) / ReportTesting.ATTEMPT_COUNT
-                os.remove(ReportTesting.TIME_LOG)
-                print(f"TIME: {average}")
-                file_averages.append(average)
-            # network.kill()
-            self.results[(delay, discard_prob)] = file_averages
-            return
+        sender_args, receiver_args = ReportTesting.PROTOCOL_MODES[mode]
+        source = os.path.join(SOURCE_DIRECTORY, filename)
+        port = self.ports.get()
+        forward, receiver_port, sender_port, backward = port, port + 1, port + 2, port + 3
+        try:
+            with tempfile.TemporaryDirectory() as scratch:
+                processes = []
 
-    def save_to_csv(self, filename):
+                def start(script, *args):
+                    p = subprocess.Popen(
+                        [sys.executable, os.path.join(SOURCE_DIRECTORY, script),
+                         *[str(a) for a in args]],
+                        cwd=scratch, stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL)
+                    processes.append(p)
+                    return p
+
+                try:
+                    start("emulator.py", forward, HOST, receiver_port, backward, HOST,
+                          sender_port, delay, discard_prob, 0, "--seed", seed)
+                    receiver = start("receiver.py", HOST, backward, receiver_port,
+                                     "output", *receiver_args)
+                    time.sleep(constants.REPORT_STARTUP_WAIT)
+                    sender = start("sender.py", HOST, forward, sender_port, source,
+                                   *sender_args)
+
+                    try:
+                        sender.wait(self.run_timeout)
+                        receiver.wait(self.run_timeout)
+                    except subprocess.TimeoutExpired:
+                        return None
+
+                    output = os.path.join(scratch, "output")
+                    if not os.path.exists(output) or \
+                            not filecmp.cmp(source, output, shallow=False):
+                        return None
+                    with open(os.path.join(scratch, "time.log"), "r") as f:
+                        return float(f.readline())
+                finally:
+                    # Stopped before the scratch directory they run in is removed.
+                    for p in processes:
+                        if p.poll() is None:
+                            p.kill()
+                            p.wait()
+        finally:
+            self.ports.put(port)
+
+    def run(self, configs: List[Tuple[int, float]], files: List[str],
+            modes: List[str], attempts: int = ATTEMPT_COUNT):
+        """ Runs every (delay, discard_prob, file, mode) cell attempts times, spread
+        over self.jobs parallel transfers.
+
+        Args:
+            configs: (delay, discard_prob) pairs to test.
+            files: Filenames to transfer.
+            modes: Keys of PROTOCOL_MODES to test.
+            attempts: Number of times to repeat each cell.
         """
+        cells = [(delay, discard_prob, f, mode)
+                 for (delay, discard_prob), f, mode in itertools.product(configs, files,
+                                                                          modes)]
+        runs = [(cell, attempt) for cell in cells for attempt in range(attempts)]
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [(cell, executor.submit(self.run_once, *cell, attempt))
+                       for cell, attempt in runs]
+            for cell, future in futures:
+                result = future.result()
+                if result is None:
+                    self.failures[cell] = self.failures.get(cell, 0) + 1
+                    print(f"FAILED: {cell}")
+                else:
+                    self.results.setdefault(cell, []).append(result)
+                    print(f"{cell}: {result:.1f} ms")
+
+    def summarize(self) -> List[Dict]:
+        """ Returns one summary row per cell with the mean, p50 and p95 transmission
+        time in milliseconds and the mean throughput in bytes per second.
+        """
+        rows = []
+        for cell in sorted(set(self.results) | set(self.failures)):
+            delay, discard_prob, filename, mode = cell
+            times = self.results.get(cell, [])
+            size = os.path.getsize(os.path.join(SOURCE_DIRECTORY, filename))
+            row = {"delay": delay, "discard_prob": discard_prob, "file": filename,
+                   "mode": mode, "runs": len(times),
+                   "failures": self.failures.get(cell, 0),
+                   "mean_ms": None, "p50_ms": None, "p95_ms": None,
+                   "throughput_Bps": None}
+            if times:
+                mean = statistics.mean(times)
+                row.update({"mean_ms": mean, "p50_ms": percentile(times, 50),
+                            "p95_ms": percentile(times, 95),
+                            "throughput_Bps": size / (mean / 1000) if mean else None})
+            rows.append(row)
+        return rows
+
+    def save_to_csv(self, filename):
+        """ Writes the summary of every cell as CSV.
 
         Args:
-            filename:
+            filename: The file to write to.
+        """
+        rows = self.summarize()
+        with open(filename, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else [])
+            writer.writeheader()
+            writer.writerows(rows)
 
+    def save_to_json(self, filename):
+        """ Writes the summary of every cell, and the raw times, as JSON.
+
+        Args:
+            filename: The file to write to.
         """
-        with open(filename, "a") as f:
-            for config, result in self.results.items():
-                print(f"{config[0]},{config[1]},{','.join([str(r) for r in result])}")
-                f.write(f"{config[0]},{config[1]},{','.join([str(r) for r in result])}\n")
+        rows = self.summarize()
+        for row in rows:
+            cell = (row["delay"], row["discard_prob"], row["file"], row["mode"])
+            row["times_ms"] = self.results.get(cell, [])
+        with open(filename, "w") as f:
+            json.dump(rows, f, indent=2)
 
 
 def main():
     parser = ArgumentParser(description='Report')
-    parser.add_argument("delay", type=int,
-                        help="The max delay of a packet")
-    parser.add_argument("prob", type=float, help="The probability a packet gets dropped.")
+    parser.add_argument("--delays", type=int, nargs="+",
+                        help="Max delays to test; with --probs, replaces the default "
+                             "(delay, prob) pairs with their cross product.")
+    parser.add_argument("--probs", type=float, nargs="+",
+                        help="Discard probabilities to test.")
+    parser.add_argument("--files", nargs="+", default=ReportTesting.FILE_SIZES,
+                        help="Files to transfer.")
+    parser.add_argument("--modes", nargs="+", default=["sack"],
+                        choices=list(ReportTesting.PROTOCOL_MODES),
+                        help="Protocol modes to test.")
+    parser.add_argument("--attempts", type=int, default=ReportTesting.ATTEMPT_COUNT,
+                        help="Number of times to repeat each cell.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="Number of transfers to run in parallel.")
+    parser.add_argument("--base-port", type=int, default=constants.REPORT_BASE_PORT,
+                        help="First port of the range used by parallel transfers.")
+    parser.add_argument("--csv", default="results.csv", help="CSV file to write.")
+    parser.add_argument("--json", default="results.json", help="JSON file to write.")
     args = parser.parse_args()
 
-    r = ReportTesting()
-    r.run(args.delay, args.prob)
-    print(r.results)
-    r.save_to_csv("results.csv")
+    configs = ReportTesting.TESTING_CONFIG
+    if args.delays or args.probs:
+        configs = list(itertools.product(args.delays or [0], args.probs or [0]))
+
+    r = ReportTesting(args.jobs, args.base_port)
+    r.run(configs, args.files, args.modes, args.attempts)
+    r.save_to_csv(args.csv)
+    r.save_to_json(args.json)
+    for row in r.summarize():
+        print(row)
+
 
 if __name__ == "__main__":
     main()
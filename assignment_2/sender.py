@@ -1,13 +1,21 @@
 from argparse import ArgumentParser
 import datetime
+import os
 from socket import socket, AF_INET, SOCK_DGRAM
-import time
-from threading import Thread
+from threading import Condition, Thread
+from typing import List, Optional, Union
 
 from packet import packet
 
+from archive import ArchiveReader, list_files
 import constants
+from custom_exceptions import CorruptPacketException, TransferAbortedException
+import gso
+from handshake import ConnectionParameters
 import log
+from pacing import TokenBucket
+from readahead import PacketReader
+from stats import SenderStats
 from window import Window
 
 logger = log.configure_sender_logger("sender", info_stdout=constants.PRINT_INFO)
@@ -15,27 +23,236 @@ logger = log.configure_sender_logger("sender", info_stdout=constants.PRINT_INFO)
 
 class Sender(object):
 
-    def __init__(self, hostname: str, ack_port: int, data_port: int, filename: str):
+    def __init__(self, hostname: str, ack_port: int, data_port: int,
+                 filename: Union[str, List[str]],
+                 fec_group_size: int = constants.FEC_GROUP_SIZE,
+                 pacing_rate: float = constants.PACING_RATE, pace_by_rtt: bool = False,
+                 stats_file: str = constants.SENDER_STATS_LOG,
+                 connection_id: int = 0, resume: bool = False,
+                 window_size: int = constants.WINDOW_SIZE,
+                 sequence_bits: int = constants.SEQUENCE_BITS, checksum: bool = True,
+                 mss: int = constants.BUFFER_SIZE, read_ahead: bool = True,
+                 use_mmap: bool = False, use_gso: bool = False, compress: bool = False):
         """ Constructor.
 
         Args:
             hostname: The hostname of the network emulator to connect to.
             data_port: The port to send the emulator data.
             ack_port: The port to receive ack messages from the sender (via emulator).
-            filename: The name of the file to transmit.
+            filename: The name of the file to transmit, or a list of files and
+                directories to transmit in one session as an archive.
+            fec_group_size: If non-zero, sends a parity packet after every
+                fec_group_size data packets.
+            pacing_rate: If positive, bytes per second to pace packets at.
+            pace_by_rtt: If True, paces packets at one window per round trip time.
+            stats_file: The file to write the transfer's statistics to as JSON.
+            connection_id: ID identifying this transfer to a multiplexing receiver.
+                Must be 0 through nEmulator, which may discard the EOT of any other.
+            resume: If True, asks the receiver how much of the file it already has
+                and continues from there. Only supported for a single file.
+            window_size: Window size to propose to the receiver.
+            sequence_bits: Number of bits of sequence number to propose to the
+                receiver. Sequence numbers wrap at 2 ** sequence_bits.
+            checksum: If False, proposes sending data without checksums.
+            mss: Maximum number of bytes of data per packet to propose to the
+                receiver. nEmulator only carries packets of the default size.
+            read_ahead: If True, the file is read and encoded into packets ahead of
+                the window on a background thread.
+            use_mmap: If True, the file is memory-mapped instead of read. Only
+                supported for a single file.
+            use_gso: If True, consecutive packets are sent with one syscall using
+                Linux UDP GSO, if the kernel supports it.
+            compress: If True, proposes compressing the file in blocks before it is
+                split into packets.
         """
         self.hostname = hostname
         self.ack_port = ack_port
         self.data_port = data_port
         self.filename = filename
+        self.filenames = [filename] if isinstance(filename, str) else list(filename)
+        self.archive = len(self.filenames) > 1 or os.path.isdir(self.filenames[0])
+        if resume and self.archive:
+            raise ValueError("Resuming is only supported when sending a single file.")
+        self.resume = resume
+        if use_mmap and self.archive:
+            raise ValueError("Memory-mapping is only supported when sending a single "
+                             "file.")
+        self.read_ahead = read_ahead
+        self.use_mmap = use_mmap
+        self.use_gso = use_gso
+        self.compress = compress
+        if not constants.MIN_SEQUENCE_BITS <= sequence_bits <= \
+                constants.MAX_SEQUENCE_BITS:
+            raise ValueError(f"Sequence numbers must have "
+                             f"{constants.MIN_SEQUENCE_BITS} to "
+                             f"{constants.MAX_SEQUENCE_BITS} bits.")
+        if not constants.FEC_HEADER_SIZE < mss <= constants.MAX_PAYLOAD_SIZE:
+            raise ValueError(f"Packets must carry {constants.FEC_HEADER_SIZE + 1} to "
+                             f"{constants.MAX_PAYLOAD_SIZE} bytes of data.")
+        self.window_size = window_size
+        self.sequence_bits = sequence_bits
+        self.checksum = checksum
+        self.mss = mss
+        # Settings the receiver confirmed, None until the handshake completes.
+        self.parameters = None
+        # Byte offset the receiver asked to continue from.
+        self.resume_offset = None
+        self.fec_group_size = fec_group_size
+        self.pacing_rate = pacing_rate
+        self.pace_by_rtt = pace_by_rtt
+        # Bytes of the file sent in each packet, known once the MSS is confirmed.
+        self.payload_size = None
         self.next_seq_num = 0
         self.eot = False
+        # Why the receiver abandoned the transfer, None while it is going well.
+        self.error = None
+        self.window = None
+        self.stats_file = stats_file
+        self.stats = SenderStats()
+        self.connection_id = connection_id
+        # Data is sent from the socket ACKs are received on, so a receiver can reply
+        # to the address packets came from.
+        self.ack_socket = None
+
+        # Signalled by the ACK thread whenever it publishes an ACK or EOT arrives.
+        # Only held to wait and notify, the window is only changed by the main thread.
+        self.window_changed = Condition()
+
+    def open_file(self):
+        """ Opens the data to transmit: the file itself, or an archive of every file
+        when sending several files or a directory.
+        """
+        if self.archive:
+            return ArchiveReader(list_files(self.filenames))
+        return open(self.filenames[0], "rb")
+
+    def get_proposal(self) -> ConnectionParameters:
+        """ Returns the settings to propose to the receiver.
+        """
+        flags = constants.FLAG_SACK | (constants.FLAG_CHECKSUM if self.checksum else 0)
+        if self.compress:
+            flags |= constants.FLAG_COMPRESSION
+        if self.archive:
+            flags |= constants.FLAG_ARCHIVE
+        return ConnectionParameters(self.window_size, self.mss, self.sequence_bits, flags)
+
+    def send_syn(self):
+        """ Sends a SYN proposing the transfer's settings.
+        """
+        self.ack_socket.sendto(
+            self.get_proposal().create_syn(self.connection_id).get_udp_data(),
+            (self.hostname, self.data_port))
+        logger.log("Sent SYN.")
+
+    def handshake(self) -> ConnectionParameters:
+        """ Proposes the transfer's settings to the receiver, resending the SYN
+        whenever the timeout expires.
+
+        Returns:
+            The settings the receiver confirmed.
+        """
+        with self.window_changed:
+            self.send_syn()
+            while not self.window_changed.wait_for(lambda: self.parameters is not None,
+                                                   constants.TIMEOUT_VALUE / 1000):
+                self.send_syn()
+        return self.parameters
+
+    def configure(self, parameters: ConnectionParameters):
+        """ Applies the settings confirmed by the receiver.
+
+        Args:
+            parameters: The settings the transfer uses.
+
+        Raises:
+            ValueError: If the receiver does not expect what is being sent, an archive
+                or a single file.
+        """
+        if parameters.has(constants.FLAG_ARCHIVE) != self.archive:
+            raise ValueError("The receiver needs --archive to receive several files or "
+                             "a directory." if self.archive else
+                             "The receiver was started with --archive, it cannot "
+                             "receive a single file.")
+        self.parameters = parameters
+        # The receiver only keeps a window of delivered packets to rebuild from.
+        if self.fec_group_size > parameters.window_size:
+            logger.log(f"FEC group size {self.fec_group_size} is larger than the "
+                       f"window, using {parameters.window_size}.")
+            self.fec_group_size = parameters.window_size
+        # Parity packets carry a small header in front of the XOR of the payloads.
+        self.payload_size = parameters.mss
+        if self.fec_group_size:
+            self.payload_size -= constants.FEC_HEADER_SIZE
+        self.stats.parameters = parameters.to_dict()
+        logger.log(f"Confirmed settings: {parameters.to_dict()}")
+
+    def create_window(self, sendto,
+                      batch_sender: Optional[gso.BatchSender] = None) -> Window:
+        """ Returns the window to send data through, using the confirmed settings.
+
+        Args:
+            sendto: Callable(data, addr) the window sends packets with.
+            batch_sender: If given, the window sends packets through it in batches.
+        """
+        packet_size = constants.HEADER_SIZE + self.parameters.mss
+        pacer = None
+        if self.pacing_rate > 0 or self.pace_by_rtt:
+            pacer = TokenBucket(self.pacing_rate, max(constants.PACING_BURST,
+                                                      2 * packet_size))
+        return Window(self.parameters.window_size, logger,
+                      fec_group_size=self.fec_group_size, pacer=pacer,
+                      pace_by_rtt=self.pace_by_rtt, stats=self.stats, sendto=sendto,
+                      connection_id=self.connection_id, modulo=self.parameters.modulo,
+                      checksum=self.parameters.has(constants.FLAG_CHECKSUM),
+                      packet_size=packet_size, batch_sender=batch_sender)
+
+    def create_reader(self, file) -> PacketReader:
+        """ Returns the reader encoding the file into packets for the window, from
+        the file's current position.
+
+        Args:
+            file: The file or archive to send.
+        """
+        return PacketReader(file, self.payload_size, self.window.seq_number,
+                            self.window.modulo, self.connection_id, self.window.checksum,
+                            background=self.read_ahead, use_mmap=self.use_mmap,
+                            compress=self.parameters.has(constants.FLAG_COMPRESSION))
+
+    def send_resume(self):
+        """ Sends a request asking the receiver where to continue the file from.
+        """
+        self.ack_socket.sendto(
+            packet.create_resume(connection_id=self.connection_id).get_udp_data(),
+            (self.hostname, self.data_port))
+        logger.log("Sent resume request.")
+
+    def request_resume(self) -> int:
+        """ Asks the receiver where to continue the file from, resending the request
+        whenever the timer expires.
+
+        Returns:
+            The byte offset to continue from.
+        """
+        with self.window_changed:
+            self.send_resume()
+            self.window.reset_timer()
+            while self.resume_offset is None:
+                remaining = self.window.time_until_timeout()
+                if remaining <= 0:
+                    self.send_resume()
+                    self.window.reset_timer()
+                else:
+                    self.window_changed.wait(remaining)
+        logger.log(f"Resuming from byte: {self.resume_offset}")
+        self.stats.resume_offset = self.resume_offset
+        return self.resume_offset
 
     def send_EOT(self, seq_num):
         """ Sends an EOT packet.
         """
-        socket(AF_INET, SOCK_DGRAM).sendto(packet.create_eot(seq_num).get_udp_data(),
-                                           (self.hostname, self.data_port))
+        self.ack_socket.sendto(
+            packet.create_eot(seq_num, self.connection_id).get_udp_data(),
+            (self.hostname, self.data_port))
         logger.log(f"Sent EOT with: {seq_num}.")
 
     def ack_recv_thread_func(self):
@@ -45,77 +262,206 @@ class Sender(object):
         Also responsible for receiving EOT packets from client and changing state for
         main thread.
         """
-        ack_socket = socket(AF_INET, SOCK_DGRAM)
-        ack_socket.bind((self.hostname, self.ack_port))
-
-        while not self.eot:
+        while not self.eot and self.error is None:
             try:
                 # Parse Packet
-                data, port = ack_socket.recvfrom(constants.ACK_BUFFER_SIZE)
+                data, port = self.ack_socket.recvfrom(constants.ACK_BUFFER_SIZE)
                 p = packet.parse_udp_data(data)
 
+                if p.connection_id != self.connection_id:
+                    logger.log(f"Ignored packet for connection: {p.connection_id}")
+                    continue
+
                 # Packet is ACK
                 if p.type == constants.TYPE_ACK:
                     logger.log(f"Received ack with seq: {p.seq_num}")
                     logger.ack(p.seq_num)
-                    self.next_seq_num = p.seq_num
-                    self.window.update_base_number(self.next_seq_num)
+                    # ACKs are cumulative for the last in-order packet received.
+                    # The main thread applies them to the window.
+                    self.window.publish_ack((p.seq_num + 1) % self.window.modulo,
+                                            p.get_sack_blocks())
+                    with self.window_changed:
+                        self.window_changed.notify()
+
+                # Packet is the receiver's answer to the SYN
+                if p.type == constants.TYPE_SYN:
+                    with self.window_changed:
+                        if self.parameters is None:
+                            self.parameters = ConnectionParameters.parse_syn(p)
+                        self.window_changed.notify()
+
+                # Packet is the receiver's answer to a resume request
+                if p.type == constants.TYPE_RESUME:
+                    with self.window_changed:
+                        self.resume_offset = p.get_resume_offset()
+                        self.window_changed.notify()
 
                 # Packet is EOT
                 if p.type == constants.TYPE_EOT:
-                    self.eot = True
+                    with self.window_changed:
+                        self.eot = True
+                        self.window_changed.notify()
                     logger.log("Received EOT.")
 
-            except TypeError as e:
+                # Packet is the receiver abandoning the transfer
+                if p.type == constants.TYPE_ABORT:
+                    with self.window_changed:
+                        self.error = TransferAbortedException(
+                            "The receiver aborted the transfer.")
+                        self.window_changed.notify()
+                    logger.log("Received ABORT.")
+
+            except (TypeError, CorruptPacketException) as e:
                 logger.log(
                     f"Received data that could not be processed: {e}.")
 
+    def update_delivered(self):
+        """ Records the bytes of the file the receiver has acknowledged so far."""
+        self.stats.bytes_delivered = self.window.bytes_acked
+
+    def wait_for_window(self, done):
+        """ Blocks until done() is True, applying the ACKs the ACK thread publishes,
+        resending the window whenever its timer expires and sending queued
+        retransmissions as the pacer allows. Must only be called from the main thread.
+
+        Args:
+            done: Callable()->bool checked every time the ACK thread publishes an ACK.
+
+        Raises:
+            TransferAbortedException: If the receiver aborted the transfer.
+        """
+        addr = (self.hostname, self.data_port)
+        while True:
+            if self.error is not None:
+                raise self.error
+            self.window.process_acks()
+            self.next_seq_num = self.window.base_number
+            self.update_delivered()
+            self.window.send_pending(addr)
+            if not self.window.has_pending_resend() and done():
+                return
+
+            remaining = self.window.time_until_timeout()
+            if remaining <= 0:
+                self.window.resend_all(addr)
+                continue
+
+            # Wake up early if the pacer is what is holding packets back.
+            pacing = self.window.time_until_send()
+            self.window.flush()
+            with self.window_changed:
+                # An ACK published since they were applied has already notified.
+                if not self.window.has_acks() and self.error is None:
+                    self.window_changed.wait(
+                        min(remaining, pacing) if pacing > 0 else remaining)
+
     def run(self):
         """ Main thread for running the sender.
         """
         # Start thread listening for ACKs.
-        t = Thread(target=self.ack_recv_thread_func).start()
-
-        # Create Window and start thread to send data.
-        self.window = Window(constants.WINDOW_SIZE, logger)
+        self.ack_socket = socket(AF_INET, SOCK_DGRAM)
+        self.ack_socket.bind((self.hostname, self.ack_port))
+        self.stats = SenderStats()
+        # A daemon, so an error on this thread does not leave it blocked on the socket.
+        t = Thread(target=self.ack_recv_thread_func, daemon=True).start()
 
-        # Read a Packet of data and attempt to send
-        with open(self.filename, "r") as f:
+        # Read a Packet of data and send as soon as the window has room
+        with self.open_file() as f:
             start = datetime.datetime.now()
-            data = f.read(constants.BUFFER_SIZE)
-            while data:
-                if not self.window.is_full():
-                    self.window.add_data(data, (self.hostname, self.data_port))
-                    data = f.read(constants.BUFFER_SIZE)
-                elif self.window.has_timeout():
-                    self.window.resend_all((self.hostname, self.data_port))
-                else:
-                    time.sleep(constants.PROCESS_WAIT)
+            self.stats.start()
+            # Agree on the settings, then create the Window with them.
+            self.configure(self.handshake())
+            batch_sender = None
+            if self.use_gso:
+                batch_sender = gso.create_batch_sender(self.ack_socket)
+                if batch_sender is None:
+                    logger.log("UDP GSO is not supported, sending packets one at a "
+                               "time.")
+            self.window = self.create_window(self.ack_socket.sendto, batch_sender)
+            if self.resume:
+                f.seek(self.request_resume())
+            with self.create_reader(f) as packets:
+                for data, udp_data, file_bytes in packets:
+                    self.wait_for_window(lambda: not self.window.is_full() and
+                                         self.window.time_until_send() <= 0)
+                    self.window.add_data(data, (self.hostname, self.data_port),
+                                         udp_data, file_bytes)
+
+        self.window.flush_parity((self.hostname, self.data_port))
+        self.window.flush()
 
-        logger.log(f"Ending transmission. {self.window.window}")
+        logger.log(f"Ending transmission. {self.window.outstanding()} packets in flight.")
 
         # Ensure all packets have been received by client
-        while not self.window.finished(self.next_seq_num):
-            if self.window.has_timeout():
-                self.window.resend_all((self.hostname, self.data_port))
-            time.sleep(constants.PROCESS_WAIT)
+        self.wait_for_window(lambda: self.window.finished(self.next_seq_num))
 
         logger.log(f"Finished sending remaining packets.")
 
         # Send and wait on EOT
-        self.send_EOT(self.window.seq_number)
-        while not self.eot:
-            if self.window.has_timeout():
-                self.send_EOT(self.window.seq_number)
-                self.window.reset_timer()
-            time.sleep(constants.PROCESS_WAIT)
+        with self.window_changed:
+            self.send_EOT(self.window.seq_number)
+            self.window.reset_timer()
+            while not self.eot:
+                if self.error is not None:
+                    raise self.error
+                remaining = self.window.time_until_timeout()
+                if remaining <= 0:
+                    self.send_EOT(self.window.seq_number)
+                    self.window.reset_timer()
+                else:
+                    self.window_changed.wait(remaining)
 
         # Log Transmission Time
         transmission_time = 1000 * (datetime.datetime.now() - start).total_seconds()
         logger.time(str(transmission_time))
+        self.stats.finish()
+        self.stats.save(self.stats_file)
         logger.log("Done.")
 
 
+def add_sender_arguments(parser: ArgumentParser):
+    """ Adds the file and the settings every sender takes to its command line.
+
+    Args:
+        parser: The sender's parser, after the arguments that come before the file.
+    """
+    parser.add_argument("filename", type=str, nargs="+",
+                        help="The name of the file to transmit. Several files or a "
+                             "directory are sent in one session as an archive.")
+    parser.add_argument("--fec", type=int, default=constants.FEC_GROUP_SIZE,
+                        help="Send a parity packet every FEC data packets (0 disables). "
+                             "At most the window size.")
+    parser.add_argument("--pace-rate", type=float, default=constants.PACING_RATE,
+                        help="Pace packets at this many bytes per second (0 disables).")
+    parser.add_argument("--pace-rtt", action="store_true",
+                        help="Pace packets at one window per measured round trip time.")
+    parser.add_argument("--stats", default=constants.SENDER_STATS_LOG,
+                        help="File to write the transfer's statistics to as JSON.")
+    parser.add_argument("--connection-id", type=int, default=0,
+                        help="ID identifying the transfer to a multiplexing receiver. "
+                             "Packets through nEmulator must keep the default, 0.")
+    parser.add_argument("--window", type=int, default=constants.WINDOW_SIZE,
+                        help="Window size to propose to the receiver.")
+    parser.add_argument("--sequence-bits", type=int, default=constants.SEQUENCE_BITS,
+                        help="Width of sequence numbers in bits to propose to the "
+                             f"receiver, {constants.MIN_SEQUENCE_BITS} to "
+                             f"{constants.MAX_SEQUENCE_BITS}.")
+    parser.add_argument("--no-checksum", dest="checksum", action="store_false",
+                        help="Propose sending data packets without checksums.")
+    parser.add_argument("--mss", type=int, default=constants.BUFFER_SIZE,
+                        help="Bytes of data per packet to propose to the receiver, up "
+                             f"to {constants.MAX_PAYLOAD_SIZE}. Packets through "
+                             "nEmulator must keep the default.")
+    parser.add_argument("--no-read-ahead", dest="read_ahead", action="store_false",
+                        help="Read and encode packets as the window has room instead "
+                             "of ahead on a background thread.")
+    parser.add_argument("--mmap", action="store_true",
+                        help="Memory-map the file instead of reading it.")
+    parser.add_argument("--compress", action="store_true",
+                        help="Propose compressing the file in blocks before it is split "
+                             "into packets.")
+
+
 def main():
     # Parse arguments
     parser = ArgumentParser(description='Sender')
@@ -125,12 +471,21 @@ def main():
                         help="The port to send the emulator data.")
     parser.add_argument("ack_port", type=int,
                         help="The port to receive ack messages from the sender (via emulator).")
-    parser.add_argument("filename", type=str,
-                        help="The name of the file to transmit.")
+    add_sender_arguments(parser)
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the bytes a receiver with --resume already "
+                             "has.")
+    parser.add_argument("--gso", action="store_true",
+                        help="Send consecutive packets with one syscall using UDP GSO "
+                             "(Linux only, falls back to one packet at a time).")
     args = parser.parse_args()
 
     # Run Sender
-    sender = Sender(args.hostname, args.ack_port, args.data_port, args.filename)
+    sender = Sender(args.hostname, args.ack_port, args.data_port, args.filename,
+                    args.fec, args.pace_rate, args.pace_rtt, args.stats,
+                    args.connection_id, args.resume, args.window, args.sequence_bits,
+                    args.checksum, args.mss, args.read_ahead, args.mmap, args.gso,
+                    args.compress)
     sender.run()
 
 
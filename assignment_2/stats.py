@@ -0,0 +1,149 @@
+import json
+import time
+from typing import Dict, Optional
+
+
+class TransferStats(object):
+    """ Counters for a single transfer, written as JSON once it finishes.
+
+    Times are seconds from time.monotonic(), reported relative to the start of the
+    transfer.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.finished = None
+        # Bytes of the file written by the receiver, or acknowledged to the sender.
+        self.bytes_delivered = 0
+        # Byte offset of the file the transfer continued from.
+        self.resume_offset = 0
+        # Settings agreed in the handshake.
+        self.parameters = None
+
+    def start(self):
+        """ Marks the start of the transfer, if it has not started already."""
+        if self.started is None:
+            self.started = time.monotonic()
+
+    def finish(self):
+        """ Marks the end of the transfer."""
+        self.finished = time.monotonic()
+
+    def elapsed(self) -> float:
+        """ Returns the number of seconds since the transfer started, or its duration
+        once it has finished.
+        """
+        if self.started is None:
+            return 0.0
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started
+
+    def to_dict(self) -> Dict:
+        """ Returns the statistics as a JSON serializable dict."""
+        elapsed = self.elapsed()
+        return {
+            "duration_s": elapsed,
+            "bytes_delivered": self.bytes_delivered,
+            "resume_offset": self.resume_offset,
+            "parameters": self.parameters,
+            "goodput_Bps": self.bytes_delivered / elapsed if elapsed > 0 else None,
+        }
+
+    def save(self, filename: str):
+        """ Writes the statistics as JSON.
+
+        Args:
+            filename: The file to write to.
+        """
+        with open(filename, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class SenderStats(TransferStats):
+    """ Statistics the sender and its window record while transmitting."""
+
+    def __init__(self):
+        super().__init__()
+        self.packets_sent = 0
+        self.parity_sent = 0
+        # Cause -> number of packets retransmitted for it.
+        self.retransmissions = {"timeout": 0}
+        self.acks_received = 0
+        self.dup_acks_received = 0
+        self.rtt_samples = []
+        # (seconds since start, packets in flight) every time the window changes.
+        self.window_occupancy = []
+        # Receivers a fan-out transfer stopped sending to for holding back the others.
+        self.receivers_dropped = []
+
+    def sent(self, retransmit_cause: Optional[str] = None):
+        """ Records a data packet being sent.
+
+        Args:
+            retransmit_cause: Why the packet was resent, None for a first
+                transmission.
+        """
+        self.start()
+        self.packets_sent += 1
+        if retransmit_cause is not None:
+            self.retransmissions[retransmit_cause] += 1
+
+    def ack(self, duplicate: bool):
+        """ Records an ACK being received.
+
+        Args:
+            duplicate: True if the ACK repeated the previous cumulative ACK.
+        """
+        self.acks_received += 1
+        if duplicate:
+            self.dup_acks_received += 1
+
+    def rtt(self, sample: float):
+        """ Records a round trip time sample in seconds."""
+        self.rtt_samples.append(sample)
+
+    def occupancy(self, in_flight: int):
+        """ Records the number of packets in flight after the window changed."""
+        self.window_occupancy.append((self.elapsed(), in_flight))
+
+    def to_dict(self) -> Dict:
+        stats = super().to_dict()
+        stats.update({
+            "packets_sent": self.packets_sent,
+            "parity_sent": self.parity_sent,
+            "retransmissions": dict(self.retransmissions),
+            "acks_received": self.acks_received,
+            "dup_acks_received": self.dup_acks_received,
+            "rtt_samples_s": self.rtt_samples,
+            "window_occupancy": self.window_occupancy,
+            "receivers_dropped": self.receivers_dropped,
+        })
+        return stats
+
+
+class ReceiverStats(TransferStats):
+    """ Statistics the receiver records while receiving."""
+
+    def __init__(self):
+        super().__init__()
+        self.packets_received = 0
+        self.out_of_order = 0
+        self.duplicates = 0
+        self.corrupt = 0
+        self.recovered = 0
+        self.acks_sent = 0
+        # Why the transfer was abandoned, None if it completed.
+        self.error = None
+
+    def to_dict(self) -> Dict:
+        stats = super().to_dict()
+        stats.update({
+            "packets_received": self.packets_received,
+            "out_of_order": self.out_of_order,
+            "duplicates": self.duplicates,
+            "corrupt": self.corrupt,
+            "recovered": self.recovered,
+            "acks_sent": self.acks_sent,
+            "error": self.error,
+        })
+        return stats
@@ -0,0 +1,153 @@
+import time
+from typing import Hashable, List, Optional
+
+import constants
+
+NANOSECONDS = 1000000000
+
+
+class Timer(object):
+    """ A restartable deadline on time.monotonic_ns(), which unlike the wall clock
+    never jumps. Times are integer nanoseconds, so checking the timer does not
+    allocate.
+    """
+
+    def __init__(self, timeout: float):
+        """ Constructor.
+
+        Args:
+            timeout: Number of seconds from a reset until the timer expires.
+        """
+        self.timeout = int(timeout * NANOSECONDS)
+        self.deadline = None
+
+    def reset(self):
+        """ Starts the timer again from now."""
+        self.deadline = time.monotonic_ns() + self.timeout
+
+    def cancel(self):
+        """ Stops the timer."""
+        self.deadline = None
+
+    def is_armed(self) -> bool:
+        """ Returns True if the timer is running. False, otherwise."""
+        return self.deadline is not None
+
+    def expired(self) -> bool:
+        """ Returns True if the timer is running and has reached its deadline. False,
+        otherwise.
+        """
+        return self.deadline is not None and time.monotonic_ns() >= self.deadline
+
+    def time_until(self) -> Optional[float]:
+        """ Returns the number of seconds until the timer expires, zero if it already
+        has, or None if it is not running.
+        """
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.monotonic_ns()) / NANOSECONDS
+
+
+class TimerWheel(object):
+    """ Deadlines for many keys, e.g. one per packet or connection, on
+    time.monotonic_ns().
+
+    Time is divided into ticks of `resolution` seconds and each deadline is kept in
+    the slot of the tick it falls in, modulo the number of slots. Arming and
+    cancelling a deadline are O(1) dict operations, and expiring only visits the
+    slots of the ticks that have passed. Deadlines more than one revolution away
+    stay in their slot until their revolution comes round.
+    """
+
+    def __init__(self, resolution: float = constants.TIMER_RESOLUTION,
+                 slots: int = constants.TIMER_WHEEL_SLOTS):
+        """ Constructor.
+
+        Args:
+            resolution: Number of seconds per tick.
+            slots: Number of ticks in one revolution of the wheel.
+        """
+        self.resolution = max(1, int(resolution * NANOSECONDS))
+        self.slots = [{} for _ in range(slots)]
+        # Map of key -> slot its deadline is in.
+        self._slot_of = {}
+        # Earliest tick that may still hold an expired deadline.
+        self._tick = time.monotonic_ns() // self.resolution
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+
+    def arm(self, key: Hashable, delay: float):
+        """ Sets a key's deadline, replacing any it already had.
+
+        Args:
+            key: What the deadline is for.
+            delay: Number of seconds from now until the deadline.
+        """
+        previous = self._slot_of.get(key)
+        if previous is not None:
+            del previous[key]
+        deadline = time.monotonic_ns() + int(delay * NANOSECONDS)
+        slot = self.slots[max(deadline // self.resolution, self._tick) %
+                          len(self.slots)]
+        slot[key] = deadline
+        self._slot_of[key] = slot
+
+    def cancel(self, key: Hashable):
+        """ Removes a key's deadline, if it has one.
+
+        Args:
+            key: What the deadline is for.
+        """
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def expire(self) -> List[Hashable]:
+        """ Removes every deadline that has passed.
+
+        Returns:
+            The keys whose deadlines passed, in no particular order.
+        """
+        now = time.monotonic_ns()
+        tick = now // self.resolution
+        expired = []
+        # After a full revolution every slot has been visited.
+        for t in range(self._tick, min(tick + 1, self._tick + len(self.slots))):
+            slot = self.slots[t % len(self.slots)]
+            if not slot:
+                continue
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]
+                del self._slot_of[key]
+            expired.extend(due)
+        # The current tick's slot may still hold later deadlines.
+        self._tick = tick
+        return expired
+
+    def time_until_next(self) -> Optional[float]:
+        """ Returns the number of seconds until the earliest deadline, zero if it has
+        passed, or None if there are no deadlines.
+        """
+        if not self._slot_of:
+            return None
+        now = time.monotonic_ns()
+        earliest = None
+        # Ticks are visited in order, so the first slot holding a deadline of its own
+        # revolution has the earliest one.
+        for t in range(self._tick, self._tick + len(self.slots)):
+            slot = self.slots[t % len(self.slots)]
+            for deadline in slot.values():
+                if deadline // self.resolution <= t and \
+                        (earliest is None or deadline < earliest):
+                    earliest = deadline
+            if earliest is not None:
+                break
+        if earliest is None:
+            # Every deadline is more than a revolution away.
+            earliest = min(d for slot in self.slots for d in slot.values())
+        return max(0, earliest - now) / NANOSECONDS
@@ -1,35 +1,140 @@
-import datetime
-from typing import Tuple
+from collections import deque
+import time
+from typing import Callable, List, Optional, Tuple
 from socket import socket, AF_INET, SOCK_DGRAM
 
+from fec import ParityEncoder
+from gso import BatchSender
 from packet import packet
+from pacing import TokenBucket
+from stats import SenderStats
+from timers import Timer
 
 import constants
 
 
 class Window(object):
+    """ Sliding window of the packets in flight.
+
+    The window has a single writer: only the thread sending through it changes it.
+    Other threads, e.g. one receiving ACKs, hand ACKs over with publish_ack, which
+    only appends to a deque, and the sending thread applies them with process_acks.
+    The sending thread therefore never needs a lock to iterate over or change the
+    window, and base_number is only published once all of an ACK is applied.
+    """
 
     def __init__(self, size, logger,
-                 timeout: datetime.timedelta = datetime.timedelta(
-                     milliseconds=constants.TIMEOUT_VALUE)):
+                 timeout: float = constants.TIMEOUT_VALUE / 1000,
+                 fec_group_size: int = constants.FEC_GROUP_SIZE,
+                 pacer: Optional[TokenBucket] = None, pace_by_rtt: bool = False,
+                 stats: Optional[SenderStats] = None,
+                 sendto: Optional[Callable[[bytes, Tuple[str, int]], None]] = None,
+                 connection_id: int = 0, modulo: int = constants.MODULO_RANGE,
+                 checksum: bool = True, packet_size: int = constants.PACKET_DATA_SIZE,
+                 batch_sender: Optional[BatchSender] = None):
         """
         Args:
             size: Window size to use in the window.
             logger: Logger with following methods: log, sequence:= Callable(str)->None
-            timeout: The timeout to use when resending packets.
+            timeout: Number of seconds without progress before the window is resent.
+            fec_group_size: If non-zero, a parity packet is sent after every
+                fec_group_size data packets so the receiver can rebuild one lost
+                packet per group without a retransmission.
+            pacer: If given, spaces out data and retransmitted packets to its rate.
+            pace_by_rtt: If True, the pacer's rate is set to one window per smoothed
+                round trip time.
+            stats: Statistics to record sends, ACKs and round trip times into.
+            sendto: Callable(data, addr) used to send packets, e.g. an asyncio
+                transport's sendto. Defaults to sending from a new UDP socket.
+            connection_id: Connection ID to put in every packet's header.
+            modulo: Number at which sequence numbers wrap.
+            checksum: If False, data and parity packets are sent without a checksum.
+            packet_size: Size in bytes of a full data packet, header included.
+            batch_sender: If given, packets are sent through it in batches instead of
+                with sendto, and only once flush is called.
         """
         self.size = size
-        self.d_timeout = timeout
         self._logger = logger
-        self.window = [None for i in range(constants.MODULO_RANGE)]
+        self.modulo = modulo
+        self.checksum = checksum
+        self.packet_size = packet_size
+        # Map of sequence number -> encoded packet of every unacknowledged packet, sent
+        # again as is. Only packets in flight are kept, however wide the sequence space.
+        self.window = {}
+        # Packets the receiver reported holding through SACK blocks.
+        self.sacked = set()
         self.seq_number = 0
         self.base_number = 0
-        self.timer = datetime.datetime.now()
+        self.timer = Timer(timeout)
+        self.timer.reset()
+        self.parity = ParityEncoder(fec_group_size) if fec_group_size else None
+        self.pacer = pacer
+        self.pace_by_rtt = pace_by_rtt
+        # Sequence numbers waiting to be retransmitted once the pacer allows.
+        self.retransmit = deque()
+        # Time each packet was first sent, None once retransmitted (Karn's algorithm).
+        self.sent_at = {}
+        # Bytes of the file each packet in flight completes, and of those acknowledged.
+        self.file_bytes = {}
+        self.bytes_acked = 0
+        self.srtt = None
+        self.stats = stats if stats is not None else SenderStats()
+        self._sendto = sendto
+        self.batch_sender = batch_sender
+        # Sequence numbers of the data packets queued in the batch sender, None for
+        # parity, and how many of them it has sent, so they are timed once they are.
+        self.batched = deque()
+        self.batched_sent = 0
+        self.connection_id = connection_id
+        # (next sequence number, SACK blocks) of ACKs published and not yet applied.
+        self.acks = deque()
+
+    def send(self, udp_data: bytes, addr: Tuple[str, int],
+             seq_num: Optional[int] = None):
+        """ Sends a packet and charges it to the pacer.
+
+        Args:
+            udp_data: The encoded packet.
+            addr: A hostname, port tuple to send data to.
+            seq_num: Sequence number of a data packet, None for a parity packet.
+        """
+        if self.batch_sender is not None:
+            self.batched.append(seq_num)
+            self.batch_sender.sendto(udp_data, addr)
+            self.stamp_batched()
+        elif self._sendto is not None:
+            self._sendto(udp_data, addr)
+        else:
+            socket(AF_INET, SOCK_DGRAM).sendto(udp_data, addr)
+        if self.pacer:
+            self.pacer.consume(len(udp_data))
+
+    def flush(self):
+        """ Sends the packets held by the batch sender, if there is one."""
+        if self.batch_sender is not None:
+            self.batch_sender.flush()
+            self.stamp_batched()
+
+    def stamp_batched(self):
+        """ Times the data packets the batch sender has sent since the last call, as
+        packets are only on their way once their batch is: their first sending for
+        round trip times, and the timer if the oldest packet in flight is among them.
+        """
+        now = time.monotonic()
+        while self.batched_sent < self.batch_sender.sent:
+            self.batched_sent += 1
+            num = self.batched.popleft()
+            if num is None or num not in self.window:
+                continue
+            if num not in self.sent_at:
+                self.sent_at[num] = now
+            if num == self.base_number:
+                self.reset_timer()
 
     def get_size(self) -> int:
         """ Returns the number of packets in the window.
         """
-        return len([i for i in self.window if i is not None])
+        return len(self.window)
 
     def is_full(self) -> bool:
         """ Returns True if the window is full and more data cannot be added,
@@ -37,31 +142,91 @@ class Window(object):
         """
         return self.get_size() >= self.size
 
-    def add_data(self, data: str, addr: Tuple[str, int]):
+    def in_flight(self, num: int) -> bool:
+        """ Returns True if the sequence number has been sent and not cumulatively
+        acknowledged. False, otherwise.
+        """
+        return (num - self.base_number) % self.modulo < self.outstanding()
+
+    def outstanding(self) -> int:
+        """ Returns the number of packets sent and not cumulatively acknowledged.
+        """
+        return (self.seq_number - self.base_number) % self.modulo
+
+    def add_data(self, data: bytes, addr: Tuple[str, int],
+                 udp_data: Optional[bytes] = None, file_bytes: Optional[int] = None):
         """ Adds and sends data to the window in the next available slot.
 
         Args:
             data: The data to be added in the window slot, expected to be fixed-size
                 bytes.
             addr: A hostname, port tuple to send data to.
+            udp_data: The data already encoded as a packet with the window's next
+                sequence number, e.g. by a readahead.PacketReader. Encoded here if None.
+            file_bytes: Number of bytes of the file the packet completes, counted in
+                bytes_acked once it is acknowledged. Defaults to the size of data.
         """
-
-        socket(AF_INET, SOCK_DGRAM).sendto(
-            packet.create_packet(self.seq_number, data).get_udp_data(),
-            addr)
+        if udp_data is None:
+            udp_data = packet.create_packet(
+                self.seq_number, data, self.connection_id).get_udp_data(self.checksum)
+        if self.get_size() == 0:
+            # First outstanding packet starts the timer.
+            self.reset_timer()
+        self.window[self.seq_number] = udp_data
+        self.file_bytes[self.seq_number] = len(data) if file_bytes is None else file_bytes
+        self.send(udp_data, addr, self.seq_number)
+        if self.batch_sender is None:
+            # Batched packets are timed once their batch is sent, see stamp_batched.
+            self.sent_at[self.seq_number] = time.monotonic()
+        self.stats.sent()
         self._logger.sequence(self.seq_number)
         self._logger.log(f"Sent packet with no: {self.seq_number}")
-        self.window[self.seq_number] = data
 
-        self.seq_number = (self.seq_number + 1) % constants.MODULO_RANGE
+        if self.parity:
+            self.send_parity(self.parity.add(self.seq_number, data), addr)
+
+        self.seq_number = (self.seq_number + 1) % self.modulo
+        self.stats.occupancy(self.outstanding())
+
+    def send_parity(self, parity: packet, addr: Tuple[str, int]):
+        """ Sends a parity packet, if there is one. Parity packets are never resent.
+
+        Args:
+            parity: A parity packet from the encoder, or None.
+            addr: A hostname, port tuple to send data to.
+        """
+        if parity is None:
+            return
+        parity.connection_id = self.connection_id
+        udp_data = parity.get_udp_data(self.checksum)
+        self.send(udp_data, addr)
+        self.stats.parity_sent += 1
+        self._logger.log(f"Sent parity packet for group starting at: {parity.seq_num}")
+
+    def flush_parity(self, addr: Tuple[str, int]):
+        """ Sends the parity packet for a partially filled group, e.g. at the end of
+        the file.
+
+        Args:
+            addr: A hostname, port tuple to send data to.
+        """
+        if self.parity:
+            self.send_parity(self.parity.flush(), addr)
 
     def has_timeout(self) -> bool:
-        """ Returns True if the current time is past the timer + timeout delta. False,
-        otherwise.
+        """ Returns True if the timer has expired. False, otherwise.
+
+        Does not change timer state.
+        """
+        return self.timer.expired()
+
+    def time_until_timeout(self) -> float:
+        """ Returns the number of seconds until the timer expires, zero if it already
+        has.
 
         Does not change timer state.
         """
-        return datetime.datetime.now() > self.timer + self.d_timeout
+        return self.timer.time_until()
 
     def finished(self, receive_num) -> bool:
         """ Returns True if the window has sent all data. False, otherwise.
@@ -69,44 +234,161 @@ class Window(object):
         Args:
             receive_num: The packet number the receiver is expecting.
         """
-        return (self.seq_number - 1) % constants.MODULO_RANGE == receive_num
+        return self.seq_number == receive_num
 
     def reset_timer(self):
         """ Resets the timer for the window."""
-        self.timer = datetime.datetime.now()
+        self.timer.reset()
+
+    def time_until_send(self) -> float:
+        """ Returns the number of seconds until the pacer allows another full-size
+        packet to be sent, zero if it may be sent now.
+        """
+        if self.pacer is None:
+            return 0.0
+        return self.pacer.time_until_available(self.packet_size)
+
+    def has_pending_resend(self) -> bool:
+        """ Returns True if packets are waiting on the pacer to be resent. False,
+        otherwise.
+        """
+        return len(self.retransmit) > 0
 
     def resend_all(self, addr: Tuple[str, int]):
-        """ Resends all data in the window.
+        """ Resends all data in the window the receiver has not selectively
+        acknowledged, as fast as the pacer allows. Packets the pacer holds back are
+        sent by later calls to send_pending.
 
         Args:
             addr: A hostname, port tuple to send data to.
         """
-        for num, data in zip(range(constants.MODULO_RANGE), self.window):
-            if data:
-                self._logger.sequence(num)
-                socket(AF_INET, SOCK_DGRAM).sendto(
-                    packet.create_packet(num, data).get_udp_data(), addr)
-                self._logger.log(f"Resent packet with no: {num}")
+        self.retransmit = deque(
+            (self.base_number + i) % self.modulo
+            for i in range((self.seq_number - self.base_number) % self.modulo)
+            if (self.base_number + i) % self.modulo not in self.sacked)
         self.reset_timer()
+        self.send_pending(addr)
+
+    def send_pending(self, addr: Tuple[str, int]):
+        """ Resends queued packets until the queue is empty or the pacer runs out.
 
-    def update_base_number(self, next_seq_num):
+        Args:
+            addr: A hostname, port tuple to send data to.
+        """
+        while self.retransmit and self.time_until_send() <= 0:
+            num = self.retransmit.popleft()
+            udp_data = self.window.get(num)
+            if udp_data is None or num in self.sacked:
+                # Acknowledged while it was waiting.
+                continue
+            self.sent_at[num] = None
+            self.send(udp_data, addr, num)
+            # Packets are only queued for resending when the timer expires.
+            self.stats.sent(retransmit_cause="timeout")
+            self._logger.sequence(num)
+            self._logger.log(f"Resent packet with no: {num}")
+
+    def update_base_number(self, next_seq_num) -> bool:
         """ Updates the base number
 
         Args:
             acked_seq_num: The new sequence number for the window.
-        :return:
+
+        Returns:
+            False if the ACK is stale, delayed behind newer ones, and was ignored.
+            True, otherwise.
         """
         if next_seq_num == self.base_number:
-            return
+            self.stats.ack(duplicate=True)
+            return True
 
-        if self.base_number > next_seq_num:
-            for i in range(self.base_number, constants.MODULO_RANGE):
-                self.window[i] = None
+        self.stats.ack(duplicate=False)
+        # Ignore stale ACKs delayed behind newer ones.
+        if not self.in_flight((next_seq_num - 1) % self.modulo):
+            return False
 
-            for i in range(0, next_seq_num):
-                self.window[i] = None
+        self.update_rtt((next_seq_num - 1) % self.modulo)
 
-        else:
-            for i in range(self.base_number, next_seq_num):
-                self.window[i] = None
+        num = self.base_number
+        while num != next_seq_num:
+            del self.window[num]
+            self.bytes_acked += self.file_bytes.pop(num)
+            self.sacked.discard(num)
+            self.sent_at.pop(num, None)
+            num = (num + 1) % self.modulo
         self.base_number = next_seq_num
+        self.stats.occupancy(self.outstanding())
+
+        # Progress was made, restart the timer for the remaining packets.
+        self.reset_timer()
+        return True
+
+    def handle_ack(self, next_seq_num: int, sack_blocks: List[Tuple[int, int]]):
+        """ Applies an ACK: slides the window past the packets it acknowledges and
+        marks the packets its SACK blocks hold. The SACK blocks of a stale ACK may
+        name packets of an earlier wrap of the sequence numbers, so they are ignored
+        with it.
+
+        Args:
+            next_seq_num: The sequence number the receiver expects next.
+            sack_blocks: (start, end) inclusive sequence number ranges from the ACK.
+        """
+        if self.update_base_number(next_seq_num):
+            self.update_sack(sack_blocks)
+
+    def publish_ack(self, next_seq_num: int, sack_blocks: List[Tuple[int, int]]):
+        """ Hands an ACK over to the thread sending through the window. Safe to call
+        from any thread, the window is only changed once process_acks is called.
+
+        Args:
+            next_seq_num: The sequence number the receiver expects next.
+            sack_blocks: (start, end) inclusive sequence number ranges from the ACK.
+        """
+        self.acks.append((next_seq_num, sack_blocks))
+
+    def has_acks(self) -> bool:
+        """ Returns True if published ACKs are waiting to be applied. False,
+        otherwise.
+        """
+        return len(self.acks) > 0
+
+    def process_acks(self):
+        """ Applies every published ACK, in the order they were published. Must only
+        be called by the thread sending through the window.
+        """
+        while self.acks:
+            self.handle_ack(*self.acks.popleft())
+
+    def update_rtt(self, acked_num: int):
+        """ Updates the smoothed round trip time from a newly acknowledged packet that
+        was only sent once, and the pacer's rate if it follows the round trip time.
+
+        Args:
+            acked_num: Sequence number of the packet that was acknowledged.
+        """
+        sent_at = self.sent_at.get(acked_num)
+        if sent_at is None:
+            return
+        sample = time.monotonic() - sent_at
+        self.stats.rtt(sample)
+        if self.srtt is None:
+            self.srtt = sample
+        else:
+            self.srtt += constants.RTT_ALPHA * (sample - self.srtt)
+
+        if self.pacer and self.pace_by_rtt and self.srtt > 0:
+            self.pacer.rate = self.size * self.packet_size / self.srtt
+
+    def update_sack(self, sack_blocks: List[Tuple[int, int]]):
+        """ Marks packets the receiver holds out of order so they are not resent.
+
+        Args:
+            sack_blocks: (start, end) inclusive sequence number ranges from an ACK.
+        """
+        for start, end in sack_blocks:
+            num = start
+            while self.in_flight(num):
+                self.sacked.add(num)
+                if num == end:
+                    break
+                num = (num + 1) % self.modulo
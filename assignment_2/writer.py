@@ -0,0 +1,120 @@
+import os
+from typing import Optional
+
+import constants
+
+
+def read_checkpoint(checkpoint: str) -> Optional[int]:
+    """ Returns the number of bytes a checkpoint records as committed to disk, None if
+    there is no checkpoint.
+
+    Args:
+        checkpoint: The checkpoint file.
+    """
+    try:
+        with open(checkpoint, "r") as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_checkpoint(checkpoint: str, offset: int):
+    """ Records that offset bytes are committed to disk. The checkpoint is replaced
+    atomically, so it is never left half written.
+
+    Args:
+        checkpoint: The checkpoint file.
+        offset: Number of bytes committed.
+    """
+    temporary = f"{checkpoint}.tmp"
+    with open(temporary, "w") as f:
+        f.write(str(offset))
+    os.replace(temporary, checkpoint)
+
+
+class FileWriter(object):
+    """ Keeps the output file open and batches in-order payloads into large writes."""
+
+    def __init__(self, filename: str, buffer_size: int = constants.WRITE_BUFFER_SIZE,
+                 preallocate: int = 0, resume_offset: Optional[int] = None,
+                 checkpoint: Optional[str] = None):
+        """ Constructor.
+
+        Args:
+            filename: The name of the file to save data into.
+            buffer_size: Number of bytes to hold in memory before writing to disk.
+            preallocate: If non-zero, the expected size of the file in bytes. The file
+                is truncated, space is reserved up front and data is written at explicit
+                offsets. Otherwise data is appended to the file, as before.
+            resume_offset: If given, the file is truncated to this many bytes and
+                written from there, continuing an interrupted transfer.
+            checkpoint: If given, a file recording how many bytes have been synced to
+                disk, updated after every flush.
+        """
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.preallocate = preallocate
+        self.checkpoint = checkpoint
+        self._buffer = bytearray()
+        # Write at explicit offsets instead of appending.
+        self._positional = bool(preallocate) or resume_offset is not None
+
+        if self._positional:
+            flags = os.O_WRONLY | os.O_CREAT
+            if resume_offset is None:
+                flags |= os.O_TRUNC
+            self._fd = os.open(filename, flags, 0o644)
+            self.offset = resume_offset or 0
+            if resume_offset is not None:
+                os.ftruncate(self._fd, resume_offset)
+        else:
+            self._fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self.offset = os.fstat(self._fd).st_size
+
+        if preallocate:
+            try:
+                os.posix_fallocate(self._fd, 0, preallocate)
+            except (AttributeError, OSError):
+                # Not every platform/filesystem supports fallocate, reserving the
+                # length is still better than growing the file on every write.
+                os.ftruncate(self._fd, max(preallocate, self.offset))
+
+    def write(self, data: bytes):
+        """ Buffers data to be written, flushing to disk once the buffer is full.
+
+        Args:
+            data: The payload to append after all previously written data.
+        """
+        self._buffer.extend(data)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """ Writes all buffered data to disk."""
+        view = memoryview(self._buffer)
+        while view:
+            if self._positional:
+                written = os.pwrite(self._fd, view, self.offset)
+            else:
+                written = os.write(self._fd, view)
+            self.offset += written
+            view = view[written:]
+        view.release()
+        self._buffer.clear()
+
+        if self.checkpoint:
+            os.fdatasync(self._fd)
+            write_checkpoint(self.checkpoint, self.offset)
+
+    def close(self):
+        """ Flushes remaining data and closes the file.
+
+        A preallocated file is truncated to the number of bytes actually written.
+        """
+        if self._fd is None:
+            return
+        self.flush()
+        if self._positional:
+            os.ftruncate(self._fd, self.offset)
+        os.close(self._fd)
+        self._fd = None